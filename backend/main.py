@@ -5,16 +5,21 @@ FastAPI application for processing tax documents
 
 import os
 import sys
+import asyncio
 import uuid
 import time
 import logging
-from datetime import datetime
-from typing import Optional
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, Awaitable, Any
 
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
 from dotenv import load_dotenv
+import orjson
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -26,7 +31,10 @@ from models.schemas import (
 from services.document_parser import DocumentParser
 from services.ai_processor import AIProcessor, MockAIProcessor
 from services.entity_extractor import EntityExtractor
+from services.batch_extractor import BatchingEntityExtractor
 from services.output_generator import OutputGenerator
+from services.cache import ResponseCache
+from services.pipeline import ProcessingPipeline
 
 # Load environment variables
 load_dotenv()
@@ -38,13 +46,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Request-path tuning knobs, read once at startup
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE_MB", "50")) * 1024 * 1024  # Default 50MB for large PDFs
+CHUNK_TOKEN_THRESHOLD = int(os.getenv("CHUNK_TOKEN_THRESHOLD", "6000"))
+DEFAULT_CONFIDENCE = float(os.getenv("DEFAULT_CONFIDENCE", "0.8"))
+APP_ENV = os.getenv("APP_ENV", "development")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Global Tax-Code Translator Agent",
     description="AI-powered agent that transforms tax documents into machine-readable formats",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -58,6 +73,7 @@ app.add_middleware(
 
 # Initialize services
 document_parser = DocumentParser()
+app.add_event_handler("shutdown", document_parser.shutdown)
 
 # Use mock processor if no API key is set (for demo purposes)
 if os.getenv("OPENAI_API_KEY"):
@@ -67,8 +83,105 @@ else:
     ai_processor = MockAIProcessor()
     logger.warning("No OPENAI_API_KEY set. Using mock processor for demo.")
 
-entity_extractor = EntityExtractor(ai_processor)
+# Coalesce concurrent small extractions into one LLM call when a batch window is configured
+batch_window_ms = int(os.getenv("EXTRACTION_BATCH_WINDOW_MS", "0"))
+if batch_window_ms > 0:
+    entity_extractor = BatchingEntityExtractor(
+        ai_processor,
+        max_batch=int(os.getenv("EXTRACTION_MAX_BATCH", "8")),
+        window_ms=batch_window_ms
+    )
+    logger.info(f"Batching entity extraction with a {batch_window_ms}ms window")
+    # Registered before ai_processor.aclose so batches stop before the LLM client does
+    app.add_event_handler("shutdown", entity_extractor.aclose)
+else:
+    entity_extractor = EntityExtractor(ai_processor)
 output_generator = OutputGenerator(ai_processor)
+app.add_event_handler("shutdown", ai_processor.aclose)
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+    ttl=int(os.getenv("CACHE_TTL_SECONDS", "3600"))
+)
+
+
+def web_concurrency() -> int:
+    """Uvicorn worker processes on this host (see __main__)"""
+    if APP_ENV == "development":
+        return 1
+    return int(os.getenv("WEB_CONCURRENCY", str(max(2, os.cpu_count() or 1))))
+
+
+def create_process_pool() -> ProcessPoolExecutor:
+    """
+    Worker processes for CPU-bound text processing on large documents, so it
+    doesn't stall the event loop
+    
+    The TEXT_PROCESS_WORKERS budget (default: CPU count) is split across uvicorn
+    workers. Workers are started by a forkserver (spawn where unavailable): forking
+    this already-threaded process (HTTP clients, OCR and executor threads) can
+    deadlock the children.
+    """
+    total_workers = int(os.getenv("TEXT_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(
+        max_workers=max(1, total_workers // web_concurrency()),
+        mp_context=multiprocessing.get_context(start_method)
+    )
+
+
+pipeline = ProcessingPipeline(
+    document_parser=document_parser,
+    ai_processor=ai_processor,
+    entity_extractor=entity_extractor,
+    output_generator=output_generator,
+    response_cache=response_cache,
+    text_executor=create_process_pool(),
+    text_executor_factory=create_process_pool,
+    chunk_token_threshold=CHUNK_TOKEN_THRESHOLD,
+    default_confidence=DEFAULT_CONFIDENCE
+)
+
+
+def model_response(model: BaseModel) -> Response:
+    """
+    Serialize an already-validated response model in a single pydantic-core pass
+    
+    Returning a Response bypasses FastAPI's dump/re-validate/serialize round trip
+    for response_model, which is costly on large entity sets
+    """
+    return Response(content=model.model_dump_json(), media_type="application/json")
+
+
+app.add_event_handler("shutdown", pipeline.shutdown)
+
+
+# Upstream AI status, refreshed in the background so /health (polled by load
+# balancers) never waits on an LLM round-trip
+ai_status = {"status": "unknown"}
+HEALTH_REFRESH_SECONDS = int(os.getenv("HEALTH_REFRESH_SECONDS", "30"))
+
+
+async def refresh_ai_status():
+    """Periodically refresh the cached AI processor health"""
+    global ai_status
+    while True:
+        try:
+            ai_status = await ai_processor.health_check()
+        except Exception as e:
+            ai_status = {"status": "unhealthy", "error": str(e)}
+        await asyncio.sleep(HEALTH_REFRESH_SECONDS)
+
+
+@app.on_event("startup")
+async def start_ai_status_refresh():
+    """Start the background AI health refresh"""
+    app.state.ai_status_task = asyncio.create_task(refresh_ai_status())
+
+
+@app.on_event("shutdown")
+async def stop_ai_status_refresh():
+    """Stop the background AI health refresh"""
+    app.state.ai_status_task.cancel()
 
 
 @app.get("/", response_model=dict)
@@ -82,6 +195,7 @@ async def root():
             "health": "/health",
             "docs": "/docs",
             "process_file": "POST /api/process",
+            "process_file_stream": "POST /api/process/stream",
             "process_text": "POST /api/process-text"
         }
     }
@@ -89,12 +203,11 @@ async def root():
 
 @app.get("/health", response_model=HealthStatus)
 async def health_check():
-    """Health check endpoint"""
-    ai_status = await ai_processor.health_check()
+    """Health check endpoint (AI status comes from the background refresh)"""
     return HealthStatus(
         status="healthy",
         version="1.0.0",
-        timestamp=datetime.utcnow(),
+        timestamp=datetime.now(timezone.utc),
         services={
             "document_parser": "healthy",
             "ai_processor": ai_status.get("status", "unknown"),
@@ -104,6 +217,31 @@ async def health_check():
     )
 
 
+async def load_upload_text(file: UploadFile, country: str) -> str:
+    """Validate an uploaded document and return its cleaned text"""
+    # Validate file
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No file provided")
+    
+    # Check file size without reading the upload into memory; the upload is
+    # already spooled to a temporary file (on disk once it grows large)
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, os.SEEK_END)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty file provided")
+    
+    # Check file size - increased limit for large tax documents
+    if size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB")
+    
+    # Parse document straight from the spooled file handle
+    logger.info(f"Processing document: {file.filename} for country: {country}")
+    await file.seek(0)
+    text, metadata = await document_parser.parse(file.file, file.filename)
+    return await pipeline.clean_text(text)
+
+
 @app.post("/api/process", response_model=ProcessingResult)
 async def process_document(
     file: UploadFile = File(...),
@@ -116,97 +254,96 @@ async def process_document(
     Process a tax document and generate machine-readable outputs
     """
     start_time = time.time()
-    document_id = str(uuid.uuid4())
+    document_id = uuid.uuid4().hex
     
     try:
-        # Validate file
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No file provided")
-        
-        # Read file content
-        content = await file.read()
-        if len(content) == 0:
-            raise HTTPException(status_code=400, detail="Empty file provided")
-        
-        # Check file size - increased limit for large tax documents
-        max_size = int(os.getenv("MAX_FILE_SIZE_MB", "50")) * 1024 * 1024  # Default 50MB for large PDFs
-        if len(content) > max_size:
-            raise HTTPException(status_code=400, detail=f"File too large. Maximum size: {max_size // (1024*1024)}MB")
-        
-        # Parse document
-        logger.info(f"Processing document: {file.filename} for country: {country}")
-        text, metadata = await document_parser.parse(content, file.filename)
-        text = document_parser.clean_text(text)
-        
-        # Detect language if not provided
-        if not language:
-            language = document_parser.detect_language(text)
+        text = await load_upload_text(file, country)
+        return model_response(await pipeline.run(
+            text=text,
+            country=country,
+            language=language,
+            context=context,
+            output_format=output_format,
+            document_id=document_id,
+            start_time=start_time
+        ))
         
-        # Get country name
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing document: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/process/stream")
+async def process_document_stream(
+    file: UploadFile = File(...),
+    country: str = Form(..., description="ISO country code (e.g., BR, DE, US)"),
+    output_format: OutputFormat = Form(default=OutputFormat.ALL),
+    language: Optional[str] = Form(default=None),
+    context: Optional[str] = Form(default=None)
+):
+    """
+    Process a tax document and stream results as NDJSON
+    The first line carries the extracted entities; each generated output follows
+    on its own line as soon as it completes, and a final line reports completion
+    """
+    start_time = time.time()
+    document_id = uuid.uuid4().hex
+    
+    try:
+        text = await load_upload_text(file, country)
         country_name = ai_processor.get_country_name(country.upper())
-        
-        # Check if document is too large and needs chunking
-        token_count = await ai_processor.estimate_tokens(text)
-        
-        if token_count > 6000:
-            # Chunk the document
-            chunks = await ai_processor.chunk_text(text, max_tokens=6000)
-            entities, raw_responses = await entity_extractor.extract_from_chunks(
-                chunks=chunks, country=country, language=language, context=context
-            )
-        else:
-            # Process as single document
-            entities, raw_response = await entity_extractor.extract(
-                document_text=text, country=country, language=language, context=context
-            )
-        
-        # Validate entities
+        language, cache_key, entities = await pipeline.analyze(text, country, language, context)
         warnings = entity_extractor.validate_entities(entities)
-        
-        # Generate outputs based on requested format
-        outputs = {}
-        if output_format in [OutputFormat.ALL, OutputFormat.JSON]:
-            outputs["json_config"] = await output_generator.generate_json_config(
-                entities, country.upper(), country_name
-            )
-        if output_format in [OutputFormat.ALL, OutputFormat.SQL]:
-            outputs["sql_migration"] = await output_generator.generate_sql_migration(
-                entities, country.upper(), country_name
-            )
-        if output_format in [OutputFormat.ALL, OutputFormat.YAML]:
-            outputs["policy_definition"] = await output_generator.generate_policy_definition(
-                entities, country.upper(), country_name
-            )
-        if output_format in [OutputFormat.ALL, OutputFormat.CODE]:
-            outputs["generated_code"] = await output_generator.generate_code(
-                entities, country.upper(), country_name
-            )
-        
-        processing_time = int((time.time() - start_time) * 1000)
-        
-        return ProcessingResult(
-            success=True,
-            document_id=document_id,
-            country=country.upper(),
-            country_name=country_name,
-            language_detected=language,
-            processing_time_ms=processing_time,
-            summary=entities.raw_extractions.get("summary", "Document processed successfully"),
-            entities=entities,
-            json_config=outputs.get("json_config"),
-            sql_migration=outputs.get("sql_migration"),
-            policy_definition=outputs.get("policy_definition"),
-            generated_code=outputs.get("generated_code"),
-            confidence_score=entities.raw_extractions.get("confidence_score", 0.8),
-            warnings=warnings + entities.raw_extractions.get("warnings", []),
-            source_sections=[]
-        )
-        
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error processing document: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    async def run_named(name: str, coro: Awaitable[Any]) -> tuple[str, Any, Optional[str]]:
+        try:
+            return name, await coro, None
+        except Exception as e:
+            logger.warning(f"{ProcessingPipeline.OUTPUT_LABELS[name]} generation failed: {e}")
+            return name, None, str(e)
+    
+    async def stream_results():
+        # Output coroutines are only created once the response is actually streaming,
+        # so a client that never starts reading leaves nothing un-awaited
+        tasks = pipeline.output_tasks(output_format, entities, country.upper(), country_name, cache_key)
+        pending = [asyncio.ensure_future(run_named(name, coro)) for name, coro in tasks.items()]
+        try:
+            yield orjson.dumps({
+                "document_id": document_id,
+                "country": country.upper(),
+                "country_name": country_name,
+                "language_detected": language,
+                "summary": entities.raw_extractions.get("summary", "Document processed successfully"),
+                "entities": entities.model_dump(mode="json"),
+                "confidence_score": entities.raw_extractions.get("confidence_score", DEFAULT_CONFIDENCE),
+                "warnings": warnings + entities.raw_extractions.get("warnings", [])
+            }) + b"\n"
+            
+            for next_done in asyncio.as_completed(pending):
+                name, result, error = await next_done
+                if error is None:
+                    yield orjson.dumps({name: result.model_dump(mode="json")}) + b"\n"
+                else:
+                    label = ProcessingPipeline.OUTPUT_LABELS[name]
+                    yield orjson.dumps({name: None, "error": f"{label} generation failed: {error}"}) + b"\n"
+        finally:
+            # Client went away or a write failed: stop the remaining LLM calls
+            for task in pending:
+                task.cancel()
+        
+        yield orjson.dumps({
+            "success": True,
+            "processing_time_ms": int((time.time() - start_time) * 1000)
+        }) + b"\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 
 @app.post("/api/process-text", response_model=ProcessingResult)
@@ -215,98 +352,23 @@ async def process_text(request: TextProcessRequest):
     Process raw text and generate machine-readable outputs
     """
     start_time = time.time()
-    document_id = str(uuid.uuid4())
+    document_id = uuid.uuid4().hex
     
     try:
         if not request.text.strip():
             raise HTTPException(status_code=400, detail="Empty text provided")
         
-        # Clean text
-        text = document_parser.clean_text(request.text)
-        
-        # Detect language if not provided
-        language = request.language or document_parser.detect_language(text)
-        
-        # Get country name
-        country_name = ai_processor.get_country_name(request.country.upper())
-        
-        # Extract entities
-        entities, raw_response = await entity_extractor.extract(
-            document_text=text,
+        text = await pipeline.clean_text(request.text)
+        return model_response(await pipeline.run(
+            text=text,
             country=request.country,
-            language=language,
-            context=request.context
-        )
-        
-        # Validate entities
-        warnings = entity_extractor.validate_entities(entities)
-        
-        # Generate outputs - handle failures gracefully
-        outputs = {}
-        generation_errors = []
-        
-        if request.output_format in [OutputFormat.ALL, OutputFormat.JSON]:
-            try:
-                outputs["json_config"] = await output_generator.generate_json_config(
-                    entities, request.country.upper(), country_name
-                )
-            except Exception as e:
-                logger.warning(f"JSON config generation failed: {e}")
-                generation_errors.append(f"JSON config generation failed: {str(e)}")
-                outputs["json_config"] = None
-        
-        if request.output_format in [OutputFormat.ALL, OutputFormat.SQL]:
-            try:
-                outputs["sql_migration"] = await output_generator.generate_sql_migration(
-                    entities, request.country.upper(), country_name
-                )
-            except Exception as e:
-                logger.warning(f"SQL migration generation failed: {e}")
-                generation_errors.append(f"SQL migration generation failed: {str(e)}")
-                outputs["sql_migration"] = None
-        
-        if request.output_format in [OutputFormat.ALL, OutputFormat.YAML]:
-            try:
-                outputs["policy_definition"] = await output_generator.generate_policy_definition(
-                    entities, request.country.upper(), country_name
-                )
-            except Exception as e:
-                logger.warning(f"Policy definition generation failed: {e}")
-                generation_errors.append(f"Policy definition generation failed: {str(e)}")
-                outputs["policy_definition"] = None
-        
-        if request.output_format in [OutputFormat.ALL, OutputFormat.CODE]:
-            try:
-                outputs["generated_code"] = await output_generator.generate_code(
-                    entities, request.country.upper(), country_name
-                )
-            except Exception as e:
-                logger.warning(f"Code generation failed: {e}")
-                generation_errors.append(f"Code generation failed: {str(e)}")
-                outputs["generated_code"] = None
-        
-        # Add generation errors to warnings
-        warnings = warnings + entities.raw_extractions.get("warnings", []) + generation_errors
-        
-        processing_time = int((time.time() - start_time) * 1000)
-        
-        return ProcessingResult(
-            success=True,
+            language=request.language,
+            context=request.context,
+            output_format=request.output_format,
             document_id=document_id,
-            country=request.country.upper(),
-            country_name=country_name,
-            language_detected=language,
-            processing_time_ms=processing_time,
-            summary=entities.raw_extractions.get("summary", "Text processed successfully"),
-            entities=entities,
-            json_config=outputs.get("json_config"),
-            sql_migration=outputs.get("sql_migration"),
-            policy_definition=outputs.get("policy_definition"),
-            generated_code=outputs.get("generated_code"),
-            confidence_score=entities.raw_extractions.get("confidence_score", 0.8),
-            warnings=warnings,
-            source_sections=[]
-        )
+            start_time=start_time,
+            default_summary="Text processed successfully"
+        ))
         
     except HTTPException:
         raise
@@ -319,7 +381,7 @@ async def process_text(request: TextProcessRequest):
 async def global_exception_handler(request, exc):
     """Global exception handler"""
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content=ErrorResponse(
             error=str(exc),
@@ -333,4 +395,16 @@ if __name__ == "__main__":
     import uvicorn
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run(app, host=host, port=port, reload=True)
+    if APP_ENV == "development":
+        uvicorn.run("main:app", host=host, port=port, reload=True)
+    else:
+        # Multiple workers on uvloop + httptools for production throughput
+        uvicorn.run(
+            "main:app",
+            host=host,
+            port=port,
+            workers=web_concurrency(),
+            loop="uvloop",
+            http="httptools",
+            reload=False
+        )
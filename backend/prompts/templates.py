@@ -2,8 +2,44 @@
 LLM Prompt Templates for Tax Document Processing
 """
 
+from functools import lru_cache
+from string import Formatter
 from typing import Optional
 
+TemplateParts = tuple[tuple[str, Optional[str]], ...]
+
+
+def _compile_template(template: str) -> TemplateParts:
+    """Pre-split a str.format template into (literal_text, field_name) pairs"""
+    return tuple((literal, field) for literal, field, _, _ in Formatter().parse(template))
+
+
+@lru_cache(maxsize=512)
+def _bind(parts: TemplateParts, **values) -> TemplateParts:
+    """
+    Partially evaluate a pre-split template, folding the given fields into the literal text
+    Cached so the per-country prefix of a prompt is only built once
+    """
+    bound = []
+    pending = ""
+    for literal, field in parts:
+        pending += literal
+        if field in values:
+            pending += str(values[field])
+        elif field is not None:
+            bound.append((pending, field))
+            pending = ""
+    bound.append((pending, None))
+    return tuple(bound)
+
+
+def _render(parts: TemplateParts, **values) -> str:
+    """Render a pre-split template, equivalent to str.format without re-parsing braces"""
+    return "".join(
+        literal if field is None else literal + str(values[field])
+        for literal, field in parts
+    )
+
 
 class PromptTemplates:
     """Collection of prompt templates for different processing stages"""
@@ -21,18 +57,8 @@ You must extract the following types of entities:
 
 Always respond with valid JSON. Be precise with numbers and dates."""
 
-    ENTITY_EXTRACTION_USER = """Analyze the following tax document and extract all relevant tax entities.
-
-DOCUMENT CONTEXT:
-- Country: {country}
-- Language: {language}
-- Additional Context: {context}
-
-DOCUMENT CONTENT:
-{document_text}
-
-Extract and return a JSON object with the following structure:
-{{
+    # JSON structure expected for a single document extraction (braces escaped for str.format)
+    ENTITY_EXTRACTION_SCHEMA = """{{
     "summary": "Brief summary of the document's main tax provisions",
     "tax_types": ["list of tax types mentioned (VAT, INCOME, CORPORATE, etc.)"],
     "rates": [
@@ -85,10 +111,43 @@ Extract and return a JSON object with the following structure:
     ],
     "confidence_score": 0.0,
     "warnings": ["any uncertainties or ambiguities found"]
-}}
+}}"""
+
+    ENTITY_EXTRACTION_USER = """Analyze the following tax document and extract all relevant tax entities.
+
+DOCUMENT CONTEXT:
+- Country: {country}
+- Language: {language}
+- Additional Context: {context}
+
+DOCUMENT CONTENT:
+{document_text}
+
+Extract and return a JSON object with the following structure:
+""" + ENTITY_EXTRACTION_SCHEMA + """
+
+Respond ONLY with the JSON object, no additional text."""
+
+    ENTITY_EXTRACTION_BATCH_SYSTEM = ENTITY_EXTRACTION_SYSTEM + """
+
+You will receive several independent documents in a single request. Extract entities from each document separately and never mix information between documents."""
+
+    ENTITY_EXTRACTION_BATCH_USER = """Analyze each of the following {count} tax documents separately and extract all relevant tax entities from each one.
+
+{documents}
+
+Return a JSON object of the form {{"documents": [...]}} where the "documents" array contains exactly {count} extraction objects, in the same order as the documents above. Each extraction object must have the following structure:
+""" + ENTITY_EXTRACTION_SCHEMA + """
 
 Respond ONLY with the JSON object, no additional text."""
 
+    ENTITY_EXTRACTION_BATCH_DOCUMENT = """--- DOCUMENT {index} ---
+- Country: {country}
+- Language: {language}
+- Additional Context: {context}
+
+{document_text}"""
+
     # ============ JSON Config Generation ============
     
     JSON_CONFIG_SYSTEM = """You are a software configuration specialist. Your task is to transform extracted tax entities into clean, machine-readable JSON configuration files that can be used by tax calculation engines."""
@@ -242,6 +301,16 @@ Requirements:
 
 Respond ONLY with the JSON object."""
 
+    # ============ Pre-split Templates ============
+    
+    _ENTITY_EXTRACTION_USER_PARTS = _compile_template(ENTITY_EXTRACTION_USER)
+    _ENTITY_EXTRACTION_BATCH_USER_PARTS = _compile_template(ENTITY_EXTRACTION_BATCH_USER)
+    _ENTITY_EXTRACTION_BATCH_DOCUMENT_PARTS = _compile_template(ENTITY_EXTRACTION_BATCH_DOCUMENT)
+    _JSON_CONFIG_USER_PARTS = _compile_template(JSON_CONFIG_USER)
+    _SQL_MIGRATION_USER_PARTS = _compile_template(SQL_MIGRATION_USER)
+    _POLICY_DEFINITION_USER_PARTS = _compile_template(POLICY_DEFINITION_USER)
+    _CODE_GENERATION_USER_PARTS = _compile_template(CODE_GENERATION_USER)
+    
     # ============ Helper Methods ============
     
     @classmethod
@@ -253,14 +322,37 @@ Respond ONLY with the JSON object."""
         context: Optional[str] = None
     ) -> tuple[str, str]:
         """Get the entity extraction prompt pair"""
-        user_prompt = cls.ENTITY_EXTRACTION_USER.format(
+        user_prompt = _render(
+            _bind(cls._ENTITY_EXTRACTION_USER_PARTS, country=country, language=language),
             document_text=document_text,
-            country=country,
-            language=language,
             context=context or "No additional context provided"
         )
         return cls.ENTITY_EXTRACTION_SYSTEM, user_prompt
     
+    @classmethod
+    def get_entity_extraction_batch_prompt(
+        cls,
+        documents: list[tuple[str, str, str, Optional[str]]]
+    ) -> tuple[str, str]:
+        """Get the prompt pair for extracting several (document_text, country, language, context) documents in one call"""
+        sections = [
+            _render(
+                cls._ENTITY_EXTRACTION_BATCH_DOCUMENT_PARTS,
+                index=i,
+                document_text=document_text,
+                country=country,
+                language=language,
+                context=context or "No additional context provided"
+            )
+            for i, (document_text, country, language, context) in enumerate(documents, 1)
+        ]
+        user_prompt = _render(
+            cls._ENTITY_EXTRACTION_BATCH_USER_PARTS,
+            count=len(documents),
+            documents="\n\n".join(sections)
+        )
+        return cls.ENTITY_EXTRACTION_BATCH_SYSTEM, user_prompt
+    
     @classmethod
     def get_json_config_prompt(
         cls,
@@ -269,10 +361,9 @@ Respond ONLY with the JSON object."""
         country_name: str
     ) -> tuple[str, str]:
         """Get the JSON config generation prompt pair"""
-        user_prompt = cls.JSON_CONFIG_USER.format(
-            entities_json=entities_json,
-            country=country,
-            country_name=country_name
+        user_prompt = _render(
+            _bind(cls._JSON_CONFIG_USER_PARTS, country=country, country_name=country_name),
+            entities_json=entities_json
         )
         return cls.JSON_CONFIG_SYSTEM, user_prompt
     
@@ -284,10 +375,9 @@ Respond ONLY with the JSON object."""
         country_name: str
     ) -> tuple[str, str]:
         """Get the SQL migration generation prompt pair"""
-        user_prompt = cls.SQL_MIGRATION_USER.format(
-            entities_json=entities_json,
-            country=country,
-            country_name=country_name
+        user_prompt = _render(
+            _bind(cls._SQL_MIGRATION_USER_PARTS, country=country, country_name=country_name),
+            entities_json=entities_json
         )
         return cls.SQL_MIGRATION_SYSTEM, user_prompt
     
@@ -299,10 +389,9 @@ Respond ONLY with the JSON object."""
         country_name: str
     ) -> tuple[str, str]:
         """Get the policy definition generation prompt pair"""
-        user_prompt = cls.POLICY_DEFINITION_USER.format(
-            entities_json=entities_json,
-            country=country,
-            country_name=country_name
+        user_prompt = _render(
+            _bind(cls._POLICY_DEFINITION_USER_PARTS, country=country, country_name=country_name),
+            entities_json=entities_json
         )
         return cls.POLICY_DEFINITION_SYSTEM, user_prompt
     
@@ -314,10 +403,13 @@ Respond ONLY with the JSON object."""
         country_name: str
     ) -> tuple[str, str]:
         """Get the code generation prompt pair"""
-        user_prompt = cls.CODE_GENERATION_USER.format(
-            entities_json=entities_json,
-            country=country,
-            country_name=country_name,
-            country_lower=country.lower()
+        user_prompt = _render(
+            _bind(
+                cls._CODE_GENERATION_USER_PARTS,
+                country=country,
+                country_name=country_name,
+                country_lower=country.lower()
+            ),
+            entities_json=entities_json
         )
         return cls.CODE_GENERATION_SYSTEM, user_prompt
@@ -1,5 +1,23 @@
 # Services package
-from services.document_parser import DocumentParser
-from services.ai_processor import AIProcessor, MockAIProcessor
-from services.entity_extractor import EntityExtractor
-from services.output_generator import OutputGenerator
+# Service classes are resolved lazily (PEP 562) so importing one service module
+# doesn't import every other service and its dependencies
+import importlib
+
+_SERVICE_MODULES = {
+    "DocumentParser": "services.document_parser",
+    "AIProcessor": "services.ai_processor",
+    "MockAIProcessor": "services.ai_processor",
+    "EntityExtractor": "services.entity_extractor",
+    "BatchingEntityExtractor": "services.batch_extractor",
+    "OutputGenerator": "services.output_generator",
+    "ResponseCache": "services.cache",
+    "ProcessingPipeline": "services.pipeline",
+}
+
+__all__ = list(_SERVICE_MODULES)
+
+
+def __getattr__(name: str):
+    if name in _SERVICE_MODULES:
+        return getattr(importlib.import_module(_SERVICE_MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
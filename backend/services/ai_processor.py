@@ -4,12 +4,22 @@ Handles communication with LLM APIs via LiteLLM
 Supports: OpenAI, Azure, Anthropic, Google, and 100+ other providers
 """
 
+import asyncio
+import bisect
+import hashlib
 import json
 import logging
 import os
-from typing import Optional, Dict, Any
+import time
+from functools import lru_cache
+from typing import Optional, Dict, Any, AsyncIterator, Iterable
+
+import httpx
+import orjson
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from services.cache import ResponseCache
+
 logger = logging.getLogger(__name__)
 
 # LiteLLM supports multiple providers - set API keys via environment variables:
@@ -20,6 +30,24 @@ logger = logging.getLogger(__name__)
 # See: https://docs.litellm.ai/docs/providers
 
 
+@lru_cache(maxsize=16)
+def _get_encoding(model: str):
+    """Get the tiktoken encoding for a model, built once and shared across calls"""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Unknown to tiktoken (e.g. non-OpenAI providers) - use the common base encoding
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _fail_pending(futures: Iterable[asyncio.Future]):
+    """Fail callers still waiting on a dispatcher that is shutting down"""
+    for future in futures:
+        if not future.done():
+            future.set_exception(RuntimeError("LLM dispatcher shut down before the request completed"))
+
+
 class AIProcessor:
     """Service for AI/LLM processing"""
     
@@ -68,6 +96,14 @@ class AIProcessor:
         "RU": "Russia",
         "UA": "Ukraine",
     }
+    _country_get = COUNTRY_NAMES.get
+    
+    # Upper bounds (in predicted output tokens) of the submit() dispatch bins;
+    # anything longer goes to a final open-ended bin
+    OUTPUT_LENGTH_BINS = (500, 1500)
+    
+    # Responses sampled above this temperature are too variable to reuse
+    CACHE_MAX_TEMPERATURE = 0.2
     
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None, api_base: Optional[str] = None):
         """
@@ -99,10 +135,92 @@ class AIProcessor:
         
         if not self.api_key:
             logger.warning("API key not set. AI processing will fail. Set OPENAI_API_KEY or provider-specific key.")
+        
+        # Pooled HTTP/2 connections shared by all LLM calls, so requests reuse
+        # connections instead of paying a TCP/TLS handshake each time
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=100)
+        timeout = httpx.Timeout(60.0, connect=5.0)
+        self._http = httpx.AsyncClient(http2=True, limits=limits, timeout=timeout)
+        
+        # Length-binned dispatch for submit(): requests with similar predicted output
+        # length are released together so short ones don't queue behind long ones
+        self.batch_window = int(os.getenv("LLM_BATCH_WINDOW_MS", "0")) / 1000
+        self.max_batch = int(os.getenv("LLM_MAX_BATCH", "8"))
+        self._output_ratio = 1.0  # Running estimate of output tokens per prompt token
+        self._bins: list[asyncio.Queue] = []
+        self._bin_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._bin_workers: list[asyncio.Task] = []
+        self._bin_dispatches: set[asyncio.Task] = set()
+        
+        # Completed responses for identical low-temperature prompts (0 entries disables)
+        cache_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+        self._llm_cache = ResponseCache(
+            maxsize=cache_entries,
+            ttl=int(os.getenv("CACHE_TTL_SECONDS", "3600"))
+        ) if cache_entries > 0 else None
+        
+        # Recent health check result, shared by concurrent and repeated probes
+        self.health_check_ttl = int(os.getenv("HEALTH_CHECK_TTL_SECONDS", "30"))
+        self._health_cache: tuple[Optional[Dict[str, Any]], float] = (None, 0.0)
+        self._health_lock = asyncio.Lock()
+    
+    def _use_shared_http_clients(self):
+        """Point LiteLLM at this processor's pooled HTTP client"""
+        import litellm
+        litellm.aclient_session = self._http
+    
+    async def aclose(self):
+        """Stop the length-bin dispatcher, failing requests still waiting in it, and close pooled HTTP connections"""
+        workers = self._bin_workers + list(self._bin_dispatches)
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        
+        # Requests queued but not yet collected into a batch
+        for queue in self._bins:
+            while not queue.empty():
+                _, future = queue.get_nowait()
+                _fail_pending([future])
+        self._bin_workers = []
+        self._bin_loop = None
+        
+        await self._http.aclose()
     
     def get_country_name(self, country_code: str) -> str:
         """Get full country name from code"""
-        return self.COUNTRY_NAMES.get(country_code.upper(), country_code)
+        # Codes normally arrive upper-cased already, so skip the copy when they are
+        if country_code.isupper():
+            return self._country_get(country_code, country_code)
+        return self._country_get(country_code.upper(), country_code)
+    
+    def _completion_kwargs(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int
+    ) -> Dict[str, Any]:
+        """Build LiteLLM completion kwargs for a prompt pair"""
+        completion_kwargs = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "max_tokens": max_tokens,
+        }
+        
+        # gpt-5 models don't support custom temperature, only temperature=1
+        if self.model.startswith("gpt-5"):
+            completion_kwargs["temperature"] = 1
+        else:
+            completion_kwargs["temperature"] = temperature
+        
+        # Add JSON response format for OpenAI models (but not gpt-5 which may not support it)
+        if self.model.startswith(("gpt-3", "gpt-4", "azure/")):
+            completion_kwargs["response_format"] = {"type": "json_object"}
+        
+        return completion_kwargs
     
     @retry(
         stop=stop_after_attempt(3),
@@ -128,42 +246,163 @@ class AIProcessor:
             LLM response text
         """
         try:
-            from litellm import completion
-            
-            # Build completion kwargs
-            completion_kwargs = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "max_tokens": max_tokens,
-            }
-            
-            # gpt-5 models don't support custom temperature, only temperature=1
-            if self.model.startswith("gpt-5"):
-                completion_kwargs["temperature"] = 1
-            else:
-                completion_kwargs["temperature"] = temperature
+            if self._llm_cache is None or temperature > self.CACHE_MAX_TEMPERATURE:
+                return await self._complete(system_prompt, user_prompt, temperature, max_tokens)
             
-            # Add JSON response format for OpenAI models (but not gpt-5 which may not support it)
-            if self.model.startswith(("gpt-3", "gpt-4", "azure/")):
-                completion_kwargs["response_format"] = {"type": "json_object"}
+            key = self._llm_cache_key(system_prompt, user_prompt, temperature, max_tokens)
+            return await self._llm_cache.get_or_compute(
+                key, lambda: self._complete(system_prompt, user_prompt, temperature, max_tokens)
+            )
             
-            response = completion(**completion_kwargs)
+        except Exception as e:
+            logger.error(f"LLM processing failed: {e}")
+            raise
+    
+    def _llm_cache_key(self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int) -> str:
+        """Hash everything that determines an LLM response into a cache key"""
+        digest = hashlib.blake2b(digest_size=32)
+        for part in (self.model, str(temperature), str(max_tokens), system_prompt, user_prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    async def _complete(self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int) -> str:
+        """Run one completion, accumulating the streamed response"""
+        parts = [
+            part async for part in self.process_stream(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        ]
+        content = "".join(parts)
+        
+        # Handle empty or None responses
+        if content.strip() == "":
+            logger.warning("LLM returned empty response, retrying...")
+            raise ValueError("LLM returned empty response")
+        
+        return content
+    
+    async def process_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 0.1,
+        max_tokens: int = 4096
+    ) -> AsyncIterator[str]:
+        """
+        Stream a prompt's response from the LLM as it is generated
+        
+        Args:
+            system_prompt: System/instruction prompt
+            user_prompt: User message/query
+            temperature: Sampling temperature (lower = more deterministic)
+            max_tokens: Maximum tokens in response
             
-            content = response.choices[0].message.content
+        Yields:
+            Partial response text, in order
+        """
+        from litellm import acompletion
+        self._use_shared_http_clients()
+        
+        response = await acompletion(
+            **self._completion_kwargs(system_prompt, user_prompt, temperature, max_tokens),
+            stream=True
+        )
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    
+    async def submit(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 0.1,
+        max_tokens: int = 4096
+    ) -> str:
+        """
+        Queue a prompt for length-binned dispatch and wait for its response
+        Falls through to process() when LLM_BATCH_WINDOW_MS is 0
+        
+        Args:
+            system_prompt: System/instruction prompt
+            user_prompt: User message/query
+            temperature: Sampling temperature (lower = more deterministic)
+            max_tokens: Maximum tokens in response
             
-            # Handle empty or None responses
-            if content is None or content.strip() == "":
-                logger.warning("LLM returned empty response, retrying...")
-                raise ValueError("LLM returned empty response")
+        Returns:
+            LLM response text
+        """
+        if self.batch_window <= 0:
+            return await self.process(system_prompt, user_prompt, temperature, max_tokens)
+        
+        prompt_tokens = await self.estimate_tokens(user_prompt)
+        predicted = min(max_tokens, int(prompt_tokens * self._output_ratio))
+        
+        self._ensure_bin_workers()
+        future = self._bin_loop.create_future()
+        request = (system_prompt, user_prompt, temperature, max_tokens, prompt_tokens)
+        await self._bins[bisect.bisect_left(self.OUTPUT_LENGTH_BINS, predicted)].put((request, future))
+        return await future
+    
+    def _ensure_bin_workers(self):
+        """Start one collector per length bin on the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._bin_loop is not loop or any(worker.done() for worker in self._bin_workers):
+            self._bin_loop = loop
+            self._bins = [asyncio.Queue() for _ in range(len(self.OUTPUT_LENGTH_BINS) + 1)]
+            self._bin_workers = [loop.create_task(self._collect_bin(queue)) for queue in self._bins]
+    
+    async def _collect_bin(self, queue: asyncio.Queue):
+        """Drain one bin into batches of up to max_batch requests or one window"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.batch_window
             
-            return content
+            try:
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                _fail_pending(future for _, future in batch)
+                raise
             
-        except Exception as e:
-            logger.error(f"LLM processing failed: {e}")
+            task = loop.create_task(self._dispatch_bin(batch))
+            self._bin_dispatches.add(task)
+            task.add_done_callback(self._bin_dispatches.discard)
+    
+    async def _dispatch_bin(self, batch: list[tuple[tuple[str, str, float, int, int], asyncio.Future]]):
+        """Run one bin's requests concurrently and resolve each caller's future"""
+        try:
+            results = await asyncio.gather(
+                *[self.process(*request[:4]) for request, _ in batch],
+                return_exceptions=True
+            )
+        except asyncio.CancelledError:
+            _fail_pending(future for _, future in batch)
             raise
+        
+        for (request, future), result in zip(batch, results):
+            if not isinstance(result, BaseException):
+                # Refine the output-length prediction (~4 chars/token)
+                observed = (len(result) // 4) / max(request[4], 1)
+                self._output_ratio = 0.9 * self._output_ratio + 0.1 * observed
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
     
     async def process_with_json_response(
         self,
@@ -184,7 +423,7 @@ class AIProcessor:
         Returns:
             Parsed JSON response
         """
-        response_text = await self.process(
+        response_text = await self.submit(
             system_prompt=system_prompt,
             user_prompt=user_prompt,
             temperature=temperature,
@@ -192,12 +431,13 @@ class AIProcessor:
         )
         
         try:
-            return json.loads(response_text)
-        except json.JSONDecodeError as e:
+            return orjson.loads(response_text)
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response: {e}")
             logger.debug(f"Response text: {response_text}")
             
-            # Try to extract JSON from the response
+            # Try to extract JSON from the response (stdlib json also accepts
+            # NaN/Infinity and big integers, which orjson rejects)
             cleaned = self._extract_json(response_text)
             if cleaned:
                 return json.loads(cleaned)
@@ -214,21 +454,60 @@ class AIProcessor:
         Returns:
             Extracted JSON string or None
         """
-        import re
-        
-        # Try to find JSON object
-        json_pattern = r'\{[\s\S]*\}'
-        matches = re.findall(json_pattern, text)
-        
-        for match in matches:
+        # Try each balanced {...} span, outermost first, so the whole object wins
+        # over any nested one that happens to parse on its own
+        for start, end in self._brace_spans(text):
+            candidate = text[start:end + 1]
+            try:
+                orjson.loads(candidate)
+                return candidate
+            except orjson.JSONDecodeError:
+                pass
             try:
-                json.loads(match)
-                return match
+                json.loads(candidate)
+                return candidate
             except json.JSONDecodeError:
                 continue
         
         return None
     
+    @staticmethod
+    def _brace_spans(text: str) -> list[tuple[int, int]]:
+        """
+        Find every balanced {...} span in one pass
+        
+        Args:
+            text: Text to scan
+            
+        Returns:
+            (start, end) index pairs ordered outermost to innermost
+        """
+        spans = []
+        stack = []
+        in_string = False
+        escaped = False
+        for i, char in enumerate(text):
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == "{":
+                stack.append(i)
+            elif char == "}":
+                if stack:
+                    spans.append((stack.pop(), i))
+            elif char == '"' and stack:
+                # Only quotes inside an object open a string; stray quotes in
+                # surrounding prose are ignored
+                in_string = True
+        
+        # Spans close innermost first; an enclosing span always starts earlier
+        spans.sort()
+        return spans
+    
     async def estimate_tokens(self, text: str) -> int:
         """
         Estimate token count for text
@@ -240,17 +519,56 @@ class AIProcessor:
             Estimated token count
         """
         try:
-            import tiktoken
-            encoding = tiktoken.encoding_for_model(self.model)
-            return len(encoding.encode(text))
+            encoding = _get_encoding(self.model)
+            # encode_ordinary skips the special-token scan; document text is never
+            # meant to contain sentinels like <|endoftext|>
+            return len(encoding.encode_ordinary(text))
         except Exception:
             # Rough estimate: 1 token ≈ 4 characters
             return len(text) // 4
     
+    async def estimate_tokens_batch(self, texts: list[str]) -> list[int]:
+        """
+        Estimate token counts for several texts in one tokenizer call
+        
+        Args:
+            texts: Input texts
+            
+        Returns:
+            Estimated token count per text, in input order
+        """
+        try:
+            encoding = _get_encoding(self.model)
+            # Encodes the texts across tiktoken's worker threads
+            batches = encoding.encode_ordinary_batch(texts, num_threads=os.cpu_count() or 8)
+            return [len(tokens) for tokens in batches]
+        except Exception:
+            return [len(text) // 4 for text in texts]
+    
+    async def exceeds_token_limit(self, text: str, max_tokens: int) -> bool:
+        """
+        Check whether text is longer than max_tokens
+        Decides from character length alone (~4 chars/token) unless the text is
+        borderline, so the tokenizer only runs in the ambiguous band
+        
+        Args:
+            text: Input text
+            max_tokens: Token limit
+            
+        Returns:
+            True if the text exceeds the limit
+        """
+        char_count = len(text)
+        if char_count < max_tokens * 10 // 3:
+            return False
+        if char_count > max_tokens * 20 // 3:
+            return True
+        return await self.estimate_tokens(text) > max_tokens
+    
     async def chunk_text(self, text: str, max_tokens: int = 6000) -> list[str]:
         """
         Split text into chunks that fit within token limits
-        Uses smart chunking that respects page/section boundaries
+        Uses smart chunking that respects page/section boundaries, then paragraph boundaries
         
         Args:
             text: Input text
@@ -265,41 +583,101 @@ class AIProcessor:
             logger.info(f"Using smart section-based chunking: {len(smart_chunks)} chunks")
             return smart_chunks
         
-        # Fall back to token-based chunking
-        try:
-            import tiktoken
-            encoding = tiktoken.encoding_for_model(self.model)
-            tokens = encoding.encode(text)
+        # Fall back to packing whole paragraphs into chunks
+        chunks = await self._pack_paragraphs(text, max_tokens)
+        logger.info(f"Using paragraph-based chunking: {len(chunks)} chunks")
+        return chunks
+    
+    async def _pack_paragraphs(self, text: str, max_tokens: int) -> list[str]:
+        """
+        Greedily pack consecutive paragraphs into chunks of up to max_tokens
+        Only a paragraph that is too large on its own is split mid-text
+        
+        Args:
+            text: Input text
+            max_tokens: Maximum tokens per chunk
             
-            chunks = []
-            current_chunk = []
-            current_count = 0
+        Returns:
+            List of text chunks
+        """
+        paragraphs = [paragraph for paragraph in text.split("\n\n") if paragraph.strip()]
+        sizes = await self.estimate_tokens_batch(paragraphs)
+        
+        chunks = []
+        current = []
+        current_tokens = 0
+        for paragraph, size in zip(paragraphs, sizes):
+            if size > max_tokens:
+                if current:
+                    chunks.append("\n\n".join(current))
+                    current, current_tokens = [], 0
+                chunks.extend(self._split_by_tokens(paragraph, max_tokens))
+                continue
+            
+            # Count one token for the paragraph separator
+            if current and current_tokens + 1 + size > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current_tokens += size + 1 if current else size
+            current.append(paragraph)
+        
+        if current:
+            chunks.append("\n\n".join(current))
+        
+        return chunks
+    
+    def _split_by_tokens(self, text: str, max_tokens: int) -> list[str]:
+        """
+        Split text into windows of up to max_tokens tokens
+        
+        Args:
+            text: Input text
+            max_tokens: Maximum tokens per chunk
             
-            for token in tokens:
-                if current_count + 1 > max_tokens:
-                    chunks.append(encoding.decode(current_chunk))
-                    current_chunk = [token]
-                    current_count = 1
-                else:
-                    current_chunk.append(token)
-                    current_count += 1
+        Returns:
+            List of text chunks
+        """
+        try:
+            encoding = _get_encoding(self.model)
+            tokens = encoding.encode_ordinary(text)
             
-            if current_chunk:
-                chunks.append(encoding.decode(current_chunk))
+            # Tokenize once, then slice the token ids into windows, ending each
+            # window on a line break where one is close enough to the limit
+            windows = []
+            start = 0
+            while start < len(tokens):
+                end = min(start + max_tokens, len(tokens))
+                if end < len(tokens):
+                    end = self._snap_to_line_break(encoding, tokens, start + max_tokens // 2, end)
+                windows.append(tokens[start:end])
+                start = end
             
-            logger.info(f"Using token-based chunking: {len(chunks)} chunks")
-            return chunks
+            # Decode all windows in one call (threaded inside tiktoken)
+            return encoding.decode_batch(windows)
             
         except Exception:
             # Fallback: simple character-based chunking
             char_limit = max_tokens * 4  # Rough estimate
-            chunks = []
-            
-            for i in range(0, len(text), char_limit):
-                chunks.append(text[i:i + char_limit])
+            return [text[i:i + char_limit] for i in range(0, len(text), char_limit)]
+    
+    @staticmethod
+    def _snap_to_line_break(encoding, tokens: list[int], lower: int, end: int) -> int:
+        """
+        Move a chunk boundary back to just after the nearest line break
+        
+        Args:
+            encoding: tiktoken encoding used to produce tokens
+            tokens: Token ids of the whole document
+            lower: Earliest acceptable boundary
+            end: Boundary at the token limit
             
-            logger.info(f"Using character-based chunking: {len(chunks)} chunks")
-            return chunks
+        Returns:
+            Adjusted boundary, or end if no line break lies in [lower, end)
+        """
+        for i in range(end - 1, lower - 1, -1):
+            if b"\n" in encoding.decode_single_token_bytes(tokens[i]):
+                return i + 1
+        return end
     
     def _smart_chunk_by_sections(self, text: str, max_tokens: int) -> list[str]:
         """
@@ -371,10 +749,28 @@ class AIProcessor:
     async def health_check(self) -> Dict[str, Any]:
         """
         Perform health check on AI service using LiteLLM
+        Results are reused for health_check_ttl seconds, and concurrent callers
+        share a single probe
         
         Returns:
             Health status dict
         """
+        result, checked_at = self._health_cache
+        if result is not None and time.monotonic() - checked_at < self.health_check_ttl:
+            return result
+        
+        async with self._health_lock:
+            # Another caller may have refreshed the result while we waited
+            result, checked_at = self._health_cache
+            if result is not None and time.monotonic() - checked_at < self.health_check_ttl:
+                return result
+            
+            result = await self._probe_health()
+            self._health_cache = (result, time.monotonic())
+            return result
+    
+    async def _probe_health(self) -> Dict[str, Any]:
+        """Make a minimal LLM call to check the provider"""
         if not self.api_key:
             return {
                 "status": "unavailable",
@@ -382,10 +778,11 @@ class AIProcessor:
             }
         
         try:
-            from litellm import completion
+            from litellm import acompletion
+            self._use_shared_http_clients()
             
             # Simple test call
-            response = completion(
+            response = await acompletion(
                 model=self.model,
                 messages=[{"role": "user", "content": "Hello"}],
                 max_tokens=5
@@ -411,6 +808,90 @@ class MockAIProcessor(AIProcessor):
     Returns realistic sample data without calling actual LLM
     """
     
+    # Canned responses, serialized once at import
+    _MOCK_EXTRACTION_JSON = orjson.dumps({
+        "summary": "Sample tax document with VAT rates and filing deadlines",
+        "tax_types": ["VAT"],
+        "rates": [
+            {
+                "name": "standard",
+                "rate": 0.19,
+                "description": "Standard VAT rate",
+                "conditions": ["goods", "services"],
+                "exemptions": ["healthcare", "education"]
+            }
+        ],
+        "brackets": [],
+        "thresholds": [
+            {
+                "name": "registration_threshold",
+                "amount": 10000,
+                "currency": "EUR",
+                "description": "VAT registration threshold"
+            }
+        ],
+        "deadlines": [
+            {
+                "name": "vat_return",
+                "deadline_type": "filing",
+                "frequency": "quarterly",
+                "day_of_period": 15,
+                "description": "Quarterly VAT return"
+            }
+        ],
+        "rules": [],
+        "confidence_score": 0.85,
+        "warnings": ["Mock data - for demonstration only"]
+    }).decode()
+    
+    _MOCK_JSON_CONFIG_JSON = orjson.dumps({
+        "version": "1.0",
+        "country": "DE",
+        "country_name": "Germany",
+        "tax_type": "VAT",
+        "rules": [
+            {
+                "rule_id": "vat_standard",
+                "name": "Standard VAT Rate",
+                "type": "rate",
+                "value": 0.19
+            }
+        ]
+    }).decode()
+    
+    _MOCK_SQL_MIGRATION_JSON = orjson.dumps({
+        "migration_name": "add_de_vat_rates_20240101",
+        "description": "Add German VAT rates",
+        "tables_affected": ["tax_rates"],
+        "up_script": "INSERT INTO tax_rates (country_code, rate) VALUES ('DE', 0.19);",
+        "down_script": "DELETE FROM tax_rates WHERE country_code = 'DE';"
+    }).decode()
+    
+    _MOCK_POLICY_JSON = orjson.dumps({
+        "policy_name": "germany_vat_policy",
+        "version": "1.0",
+        "description": "German VAT policy",
+        "rules": []
+    }).decode()
+    
+    _MOCK_CODE_JSON = orjson.dumps({
+        "filename": "tax_calculator_de.py",
+        "description": "German tax calculator",
+        "dependencies": [],
+        "code": "# Mock code\nclass TaxCalculator:\n    pass"
+    }).decode()
+    
+    _MOCK_DEFAULT_JSON = orjson.dumps({"message": "Mock response"}).decode()
+    
+    # Prompt keyword -> mock response, checked in order
+    _DISPATCH = (
+        ("extract", _MOCK_EXTRACTION_JSON),
+        ("json config", _MOCK_JSON_CONFIG_JSON),
+        ("sql", _MOCK_SQL_MIGRATION_JSON),
+        ("policy", _MOCK_POLICY_JSON),
+        ("code", _MOCK_CODE_JSON),
+    )
+    
     def __init__(self):
         super().__init__(api_key="mock-key", model="mock-model")
     
@@ -422,96 +903,27 @@ class MockAIProcessor(AIProcessor):
         max_tokens: int = 4096
     ) -> str:
         """Return mock response based on prompt type"""
+        prompt = system_prompt.lower()
         
-        if "extract" in system_prompt.lower():
-            return json.dumps(self._get_mock_extraction())
-        elif "json config" in system_prompt.lower():
-            return json.dumps(self._get_mock_json_config())
-        elif "sql" in system_prompt.lower():
-            return json.dumps(self._get_mock_sql_migration())
-        elif "policy" in system_prompt.lower():
-            return json.dumps(self._get_mock_policy())
-        elif "code" in system_prompt.lower():
-            return json.dumps(self._get_mock_code())
-        else:
-            return json.dumps({"message": "Mock response"})
-    
-    def _get_mock_extraction(self) -> dict:
-        return {
-            "summary": "Sample tax document with VAT rates and filing deadlines",
-            "tax_types": ["VAT"],
-            "rates": [
-                {
-                    "name": "standard",
-                    "rate": 0.19,
-                    "description": "Standard VAT rate",
-                    "conditions": ["goods", "services"],
-                    "exemptions": ["healthcare", "education"]
-                }
-            ],
-            "brackets": [],
-            "thresholds": [
-                {
-                    "name": "registration_threshold",
-                    "amount": 10000,
-                    "currency": "EUR",
-                    "description": "VAT registration threshold"
-                }
-            ],
-            "deadlines": [
-                {
-                    "name": "vat_return",
-                    "deadline_type": "filing",
-                    "frequency": "quarterly",
-                    "day_of_period": 15,
-                    "description": "Quarterly VAT return"
-                }
-            ],
-            "rules": [],
-            "confidence_score": 0.85,
-            "warnings": ["Mock data - for demonstration only"]
-        }
-    
-    def _get_mock_json_config(self) -> dict:
-        return {
-            "version": "1.0",
-            "country": "DE",
-            "country_name": "Germany",
-            "tax_type": "VAT",
-            "rules": [
-                {
-                    "rule_id": "vat_standard",
-                    "name": "Standard VAT Rate",
-                    "type": "rate",
-                    "value": 0.19
-                }
-            ]
-        }
-    
-    def _get_mock_sql_migration(self) -> dict:
-        return {
-            "migration_name": "add_de_vat_rates_20240101",
-            "description": "Add German VAT rates",
-            "tables_affected": ["tax_rates"],
-            "up_script": "INSERT INTO tax_rates (country_code, rate) VALUES ('DE', 0.19);",
-            "down_script": "DELETE FROM tax_rates WHERE country_code = 'DE';"
-        }
-    
-    def _get_mock_policy(self) -> dict:
-        return {
-            "policy_name": "germany_vat_policy",
-            "version": "1.0",
-            "description": "German VAT policy",
-            "rules": []
-        }
+        if "several independent documents" in prompt:
+            count = user_prompt.count("--- DOCUMENT ")
+            return '{"documents":[' + ",".join([self._MOCK_EXTRACTION_JSON] * count) + "]}"
+        
+        for keyword, response in self._DISPATCH:
+            if keyword in prompt:
+                return response
+        
+        return self._MOCK_DEFAULT_JSON
     
-    def _get_mock_code(self) -> dict:
-        return {
-            "filename": "tax_calculator_de.py",
-            "description": "German tax calculator",
-            "dependencies": [],
-            "code": "# Mock code\nclass TaxCalculator:\n    pass"
-        }
+    async def process_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 0.1,
+        max_tokens: int = 4096
+    ) -> AsyncIterator[str]:
+        """Yield the mock response as a single chunk"""
+        yield await self.process(system_prompt, user_prompt, temperature, max_tokens)
     
     def is_available(self) -> bool:
         return True
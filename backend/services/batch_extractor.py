@@ -0,0 +1,154 @@
+"""
+Batching Entity Extractor Service
+Coalesces concurrent small extraction requests into a single multi-document LLM call
+"""
+
+import asyncio
+import logging
+from typing import Optional, Dict, Any, Iterable
+
+from models.schemas import ExtractedEntities
+from services.ai_processor import AIProcessor
+from services.entity_extractor import EntityExtractor
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingEntityExtractor(EntityExtractor):
+    """
+    Entity extractor that micro-batches concurrent requests
+    Requests arriving within a short window share one prompt (and its system-prompt
+    tokens); large documents bypass the batcher and are extracted directly
+    """
+
+    def __init__(
+        self,
+        ai_processor: AIProcessor,
+        max_batch: int = 8,
+        window_ms: int = 20,
+        max_document_chars: int = 8000
+    ):
+        """
+        Initialize Batching Entity Extractor
+
+        Args:
+            ai_processor: AI processor instance for LLM calls
+            max_batch: Maximum documents combined into one LLM call
+            window_ms: How long to wait for more requests after the first one arrives
+            max_document_chars: Documents longer than this are extracted individually
+        """
+        super().__init__(ai_processor)
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.max_document_chars = max_document_chars
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._dispatches: set[asyncio.Task] = set()
+
+    async def extract(
+        self,
+        document_text: str,
+        country: str,
+        language: str = "en",
+        context: Optional[str] = None
+    ) -> tuple[ExtractedEntities, Dict[str, Any]]:
+        """Extract tax entities, batching with other concurrent requests when possible"""
+        if len(document_text) > self.max_document_chars:
+            return await super().extract(document_text, country, language, context)
+
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put(((document_text, country, language, context), future))
+        return await future
+
+    async def aclose(self):
+        """Stop the batch collector and in-flight batches, failing requests still waiting on them"""
+        tasks = ([self._worker] if self._worker is not None else []) + list(self._dispatches)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Requests queued but not yet collected into a batch
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            self._fail_pending([future])
+        self._worker = None
+        self._loop = None
+
+    @staticmethod
+    def _fail_pending(futures: Iterable[asyncio.Future]):
+        """Fail callers still waiting on a batcher that is shutting down"""
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError("Extraction batcher shut down before the request completed"))
+
+    def _ensure_worker(self):
+        """Start the batch collector on the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._collect())
+
+    async def _collect(self):
+        """Drain the queue into batches of up to max_batch items or one window"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+
+            try:
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                self._fail_pending(future for _, future in batch)
+                raise
+
+            # Dispatch without blocking collection of the next batch
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: list[tuple[tuple[str, str, str, Optional[str]], asyncio.Future]]):
+        """Run one batch and resolve each caller's future with its own result"""
+        try:
+            await self._run_batch(batch)
+        except asyncio.CancelledError:
+            self._fail_pending(future for _, future in batch)
+            raise
+
+    async def _run_batch(self, batch: list[tuple[tuple[str, str, str, Optional[str]], asyncio.Future]]):
+        """Extract one batch's documents and resolve their futures"""
+        documents = [document for document, _ in batch]
+
+        if len(documents) == 1:
+            results = await asyncio.gather(
+                EntityExtractor.extract(self, *documents[0]), return_exceptions=True
+            )
+        else:
+            logger.info(f"Extracting {len(documents)} documents in one batched call")
+            try:
+                results = await self.extract_batch(documents)
+            except Exception as e:
+                logger.warning(f"Batched extraction failed, falling back to per-document calls: {e}")
+                results = await asyncio.gather(
+                    *[EntityExtractor.extract(self, *document) for document in documents],
+                    return_exceptions=True
+                )
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
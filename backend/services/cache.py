@@ -0,0 +1,82 @@
+"""
+Response Cache Service
+In-process TTL cache for LLM-backed results, so reprocessing an identical
+document skips the LLM round-trips entirely
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Async TTL cache with single-flight: concurrent misses on a key share one computation"""
+
+    def __init__(self, maxsize: int = 1024, ttl: int = 3600):
+        """
+        Initialize Response Cache
+
+        Args:
+            maxsize: Maximum number of cached entries
+            ttl: Time-to-live of each entry in seconds
+        """
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # key -> [lock, number of callers holding or waiting on it]
+        self._locks: Dict[str, list] = {}
+
+    @staticmethod
+    def make_key(text: str, country: str, language: str, context: Optional[str] = None) -> str:
+        """
+        Build a cache key from everything that influences extraction
+
+        Args:
+            text: Cleaned document text
+            country: ISO country code
+            language: Document language
+            context: Additional context
+
+        Returns:
+            Hex digest identifying the request
+        """
+        payload = "\0".join([country.upper(), language, context or "", text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for key, computing and storing it on a miss
+
+        Args:
+            key: Cache key
+            compute: Zero-argument callable returning the awaitable to run on a miss
+
+        Returns:
+            Cached or freshly computed value (failures are not cached)
+        """
+        if key in self._cache:
+            logger.debug(f"Cache hit: {key}")
+            return self._cache[key]
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # Another request may have filled the entry while we waited
+                if key in self._cache:
+                    return self._cache[key]
+
+                value = await compute()
+                self._cache[key] = value
+                return value
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    def clear(self):
+        """Drop all cached entries"""
+        self._cache.clear()
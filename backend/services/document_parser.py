@@ -3,33 +3,134 @@ Document Parser Service
 Handles extraction of text from various document formats (PDF, DOCX, TXT)
 """
 
+import asyncio
 import io
 import logging
-from typing import Optional, Tuple
-from pathlib import Path
+import os
+import re
+import threading
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import Optional, Tuple, Union, BinaryIO, Callable, Iterable, AsyncIterator, Any
 
 logger = logging.getLogger(__name__)
 
+# clean_text patterns
+_HORIZONTAL_WS_RE = re.compile(r'[ \t]+')
+_EXCESS_NEWLINES_RE = re.compile(r'\n{3,}')
+
+# Marks the end of a PDF page stream
+_END_OF_PAGES = object()
+
+
+class _ExtractionStopped(Exception):
+    """Raised in the page producer thread once the consumer has gone away"""
+
+
+# Common words in different languages
+_LANGUAGE_MARKERS = {
+    'en': ['the', 'and', 'is', 'are', 'shall', 'must', 'tax', 'rate', 'income'],
+    'pt': ['o', 'a', 'de', 'da', 'do', 'imposto', 'taxa', 'alíquota', 'renda'],
+    'es': ['el', 'la', 'de', 'del', 'impuesto', 'tasa', 'renta', 'gravamen'],
+    'de': ['der', 'die', 'das', 'und', 'steuer', 'satz', 'einkommen', 'betrag'],
+    'fr': ['le', 'la', 'de', 'du', 'impôt', 'taux', 'revenu', 'taxe'],
+    'it': ['il', 'la', 'di', 'del', 'imposta', 'tasso', 'reddito', 'aliquota'],
+}
+
+def _build_marker_automaton():
+    """Compile all language markers into one Aho-Corasick automaton, or None if pyahocorasick is missing"""
+    try:
+        import ahocorasick
+    except ImportError:
+        return None
+    
+    languages_by_marker = {}
+    for lang, markers in _LANGUAGE_MARKERS.items():
+        for marker in markers:
+            languages_by_marker.setdefault(marker, []).append(lang)
+    
+    automaton = ahocorasick.Automaton()
+    for marker, languages in languages_by_marker.items():
+        # Space-delimited so only whole words match
+        automaton.add_word(f" {marker} ", (marker, tuple(languages)))
+    automaton.make_automaton()
+    return automaton
+
+
+_MARKER_AUTOMATON = _build_marker_automaton()
+
+
+@lru_cache(maxsize=1)
+def _installed_ocr_languages() -> frozenset:
+    """Language packs available to tesseract, looked up once"""
+    try:
+        import pytesseract
+        return frozenset(pytesseract.get_languages(config=""))
+    except Exception:
+        return frozenset()
+
+
+def _import_pymupdf():
+    """Import PyMuPDF under its current or legacy module name, or return None"""
+    try:
+        import pymupdf
+        return pymupdf
+    except ImportError:
+        pass
+    try:
+        import fitz
+        return fitz
+    except ImportError:
+        return None
+
 
 class DocumentParser:
     """Service for parsing and extracting text from documents"""
     
     SUPPORTED_EXTENSIONS = {'.pdf', '.txt', '.docx', '.doc'}
     
-    def __init__(self):
+    # OCR renders pages in grayscale at this resolution and reads them as one
+    # uniform block of text (--psm 6), skipping tesseract's full layout analysis
+    OCR_DPI = 200
+    OCR_CONFIG = "--psm 6"
+    
+    # detect_language codes -> tesseract language packs
+    OCR_LANGUAGES = {'en': 'eng', 'pt': 'por', 'es': 'spa', 'de': 'deu', 'fr': 'fra', 'it': 'ita'}
+    
+    def __init__(self, ocr_workers: Optional[int] = None):
+        """
+        Initialize Document Parser
+        
+        Args:
+            ocr_workers: Pages OCR'd in parallel (defaults to the CPU count)
+        """
         self._check_dependencies()
+        # Each OCR call runs tesseract as a subprocess, so a thread pool gives real parallelism
+        self.ocr_workers = ocr_workers or os.cpu_count() or 4
+        self._ocr_executor = ThreadPoolExecutor(max_workers=self.ocr_workers, thread_name_prefix="ocr")
+    
+    def shutdown(self):
+        """Stop the OCR executor's workers"""
+        self._ocr_executor.shutdown(wait=False, cancel_futures=True)
     
     def _check_dependencies(self):
         """Check if required dependencies are available"""
         self.pdf_available = False
+        self.pdf_backend = None
         self.docx_available = False
         self.ocr_available = False
         
-        try:
-            import pdfplumber
-            self.pdf_available = True
-        except ImportError:
-            logger.warning("pdfplumber not installed. PDF support disabled.")
+        # Prefer PyMuPDF (native text extraction); pdfplumber is the slower fallback
+        if _import_pymupdf() is not None:
+            self.pdf_backend = "pymupdf"
+        else:
+            try:
+                import pdfplumber
+                self.pdf_backend = "pdfplumber"
+            except ImportError:
+                logger.warning("Neither PyMuPDF nor pdfplumber installed. PDF support disabled.")
+        self.pdf_available = self.pdf_backend is not None
         
         try:
             from docx import Document
@@ -44,26 +145,23 @@ class DocumentParser:
         except ImportError:
             logger.warning("pytesseract/Pillow not installed. OCR support disabled.")
     
-    async def parse(self, file_content: bytes, filename: str) -> Tuple[str, dict]:
+    async def parse(self, file_content: Union[bytes, BinaryIO], filename: str) -> Tuple[str, dict]:
         """
         Parse document and extract text
         
         Args:
-            file_content: Raw file bytes
+            file_content: Raw file bytes, or a seekable binary file handle positioned at the start
             filename: Original filename
             
         Returns:
             Tuple of (extracted_text, metadata)
         """
-        extension = Path(filename).suffix.lower()
-        
-        if extension not in self.SUPPORTED_EXTENSIONS:
-            raise ValueError(f"Unsupported file type: {extension}")
+        extension, file_content, size_bytes = self._open_input(file_content, filename)
         
         metadata = {
             "filename": filename,
             "extension": extension,
-            "size_bytes": len(file_content),
+            "size_bytes": size_bytes,
             "pages": None,
             "extraction_method": None
         }
@@ -80,58 +178,262 @@ class DocumentParser:
         metadata.update(meta)
         return text, metadata
     
-    async def _parse_pdf(self, content: bytes) -> Tuple[str, dict]:
+    async def iter_pages(
+        self,
+        file_content: Union[bytes, BinaryIO],
+        filename: str
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Yield document text page by page as it is extracted
+        PDF pages are streamed, so only a few pages are held in memory at once;
+        other formats are yielded as a single page
+        
+        Args:
+            file_content: Raw file bytes, or a seekable binary file handle positioned at the start
+            filename: Original filename
+            
+        Yields:
+            Tuple of (page_num, page_text) for each page with text
+        """
+        extension, file_content, _ = self._open_input(file_content, filename)
+        
+        if extension == '.pdf':
+            # aclosing stops the page producer as soon as our own consumer stops
+            async with aclosing(self._iter_pdf_pages(file_content, {})) as pdf_pages:
+                async for page_num, page_text, _ in pdf_pages:
+                    yield page_num, page_text
+            return
+        
+        if extension == '.txt':
+            text, _ = await self._parse_text(file_content)
+        else:
+            text, _ = await self._parse_docx(file_content)
+        if text:
+            yield 1, text
+    
+    def _open_input(self, file_content: Union[bytes, BinaryIO], filename: str) -> Tuple[str, BinaryIO, int]:
+        """Validate the file type and return (extension, seekable stream, size in bytes)"""
+        extension = os.path.splitext(filename)[1].lower()
+        
+        if extension not in self.SUPPORTED_EXTENSIONS:
+            raise ValueError(f"Unsupported file type: {extension}")
+        
+        if isinstance(file_content, (bytes, bytearray)):
+            return extension, io.BytesIO(file_content), len(file_content)
+        
+        size_bytes = file_content.seek(0, io.SEEK_END)
+        file_content.seek(0)
+        return extension, file_content, size_bytes
+    
+    async def _parse_pdf(self, content: BinaryIO) -> Tuple[str, dict]:
         """Extract text from PDF file"""
+        metadata = {}
+        text_parts = [
+            f"--- Page {page_num} (OCR) ---\n{page_text}" if is_ocr else f"--- Page {page_num} ---\n{page_text}"
+            async for page_num, page_text, is_ocr in self._iter_pdf_pages(content, metadata)
+        ]
+        return "\n\n".join(text_parts), metadata
+    
+    async def _iter_pdf_pages(self, content: BinaryIO, metadata: dict) -> AsyncIterator[Tuple[int, str, bool]]:
+        """
+        Yield (page_num, page_text, is_ocr) for each PDF page with text, in page order
+        Pages are extracted in a worker thread that runs a bounded number of pages
+        ahead of the consumer; metadata is filled in as extraction proceeds
+        """
         if not self.pdf_available:
-            raise RuntimeError("PDF parsing not available. Install pdfplumber.")
+            raise RuntimeError("PDF parsing not available. Install PyMuPDF or pdfplumber.")
         
-        import pdfplumber
+        method = self.pdf_backend
+        metadata["extraction_method"] = method
+        produce = self._produce_pymupdf_pages if method == "pymupdf" else self._produce_pdfplumber_pages
         
-        text_parts = []
-        metadata = {"extraction_method": "pdfplumber"}
+        # The producer gets its own thread rather than a default-executor slot, and the
+        # consumer awaits an asyncio.Queue: a blocking get() on the shared executor
+        # would deadlock once every executor thread was a producer waiting for space
+        loop = asyncio.get_running_loop()
+        pages = asyncio.Queue(maxsize=self.ocr_workers * 2)
+        stop = threading.Event()
+        finished = asyncio.Event()
         
-        with pdfplumber.open(io.BytesIO(content)) as pdf:
-            metadata["pages"] = len(pdf.pages)
-            
-            for page_num, page in enumerate(pdf.pages, 1):
-                page_text = page.extract_text()
+        def emit(item: Any):
+            # Backpressure: block this producer thread until the queue has room
+            if stop.is_set():
+                raise _ExtractionStopped()
+            coro = pages.put(item)
+            try:
+                put = asyncio.run_coroutine_threadsafe(coro, loop)
+            except RuntimeError:
+                coro.close()
+                raise _ExtractionStopped()  # Event loop closed under us
+            while True:
+                try:
+                    put.result(timeout=0.1)
+                    return
+                except FutureTimeoutError:
+                    if stop.is_set():
+                        put.cancel()
+                        raise _ExtractionStopped()
+        
+        def run():
+            try:
+                try:
+                    produce(content, metadata, emit)
+                except _ExtractionStopped:
+                    return
+                except Exception as e:
+                    emit(e)
+                    return
+                emit(_END_OF_PAGES)
+            except _ExtractionStopped:
+                pass
+            finally:
+                try:
+                    loop.call_soon_threadsafe(finished.set)
+                except RuntimeError:
+                    pass  # Event loop already closed
+        
+        threading.Thread(target=run, name="pdf-pages", daemon=True).start()
+        try:
+            page_num = 0
+            while True:
+                item = await pages.get()
+                if item is _END_OF_PAGES:
+                    break
+                if isinstance(item, Exception):
+                    raise item
                 
+                page_num += 1
+                page_text, ocr_future = item
+                if ocr_future is not None:
+                    page_text = await asyncio.wrap_future(ocr_future)
+                    if page_text:
+                        metadata["extraction_method"] = f"{method}+ocr"
                 if page_text:
-                    text_parts.append(f"--- Page {page_num} ---\n{page_text}")
-                else:
-                    # Try OCR if text extraction fails
-                    if self.ocr_available:
-                        ocr_text = await self._ocr_page(page)
-                        if ocr_text:
-                            text_parts.append(f"--- Page {page_num} (OCR) ---\n{ocr_text}")
-                            metadata["extraction_method"] = "pdfplumber+ocr"
+                    yield page_num, page_text, ocr_future is not None
+        finally:
+            stop.set()
+            await finished.wait()
+    
+    def _produce_pymupdf_pages(self, content: BinaryIO, metadata: dict, emit: Callable[[Any], None]):
+        """Extract PDF pages with PyMuPDF (blocking)"""
+        pymupdf = _import_pymupdf()
         
-        return "\n\n".join(text_parts), metadata
+        def render(page):
+            from PIL import Image
+            pixmap = page.get_pixmap(dpi=self.OCR_DPI, colorspace=pymupdf.csGRAY)
+            return Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+        
+        with pymupdf.open(**self._pymupdf_source(content), filetype="pdf") as pdf:
+            metadata["pages"] = pdf.page_count
+            self._produce_pages(pdf, lambda page: page.get_text("text").strip(), render, emit)
     
-    async def _parse_text(self, content: bytes) -> Tuple[str, dict]:
-        """Extract text from plain text file"""
-        # Try different encodings
-        encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+    @staticmethod
+    def _pymupdf_source(content: BinaryIO) -> dict:
+        """
+        Pick how PyMuPDF should open the input without copying a file-backed upload
         
-        for encoding in encodings:
-            try:
-                text = content.decode(encoding)
-                return text, {"extraction_method": "text", "encoding": encoding}
-            except UnicodeDecodeError:
+        Args:
+            content: Seekable binary file handle positioned at the start
+            
+        Returns:
+            Keyword arguments for pymupdf.open (a filename, or an in-memory stream)
+        """
+        name = getattr(content, "name", None)
+        if isinstance(name, str) and os.path.isfile(name):
+            return {"filename": name}
+        # Rolled-over spooled uploads are anonymous temp files known only by descriptor
+        if isinstance(name, int) and os.path.isfile(f"/proc/self/fd/{name}"):
+            return {"filename": f"/proc/self/fd/{name}"}
+        if isinstance(content, io.BytesIO):
+            return {"stream": content}
+        return {"stream": content.read()}
+    
+    def _produce_pdfplumber_pages(self, content: BinaryIO, metadata: dict, emit: Callable[[Any], None]):
+        """Extract PDF pages with pdfplumber (blocking)"""
+        import pdfplumber
+        
+        with pdfplumber.open(content) as pdf:
+            metadata["pages"] = len(pdf.pages)
+            self._produce_pages(
+                pdf.pages,
+                lambda page: page.extract_text(),
+                lambda page: page.to_image(resolution=self.OCR_DPI).original.convert("L"),
+                emit
+            )
+    
+    def _produce_pages(
+        self,
+        pages: Iterable,
+        get_text: Callable[..., Optional[str]],
+        render: Callable,
+        emit: Callable[[Any], None]
+    ):
+        """
+        Emit (text, ocr_future) for each page, queueing OCR for pages without text
+        Rendering continues while earlier pages are OCR'd; at most two rendered
+        pages per OCR worker are held in memory at once
+        
+        Args:
+            pages: PDF pages, in order
+            get_text: Returns a page's embedded text
+            render: Returns a page as a PIL image
+            emit: Receives one (text, ocr_future) pair per page; exactly one of the two is set
+        """
+        in_flight = threading.BoundedSemaphore(self.ocr_workers * 2)
+        ocr_language = None
+        
+        for page in pages:
+            page_text = get_text(page)
+            if page_text or not self.ocr_available:
+                # OCR later scanned pages in the language of the first text page
+                if page_text and ocr_language is None:
+                    ocr_language = self.OCR_LANGUAGES.get(self.detect_language(page_text))
+                emit((page_text, None))
                 continue
+            
+            in_flight.acquire()
+            try:
+                future = self._ocr_executor.submit(self._ocr_image, render(page), ocr_language)
+            except BaseException:
+                in_flight.release()
+                raise
+            future.add_done_callback(lambda _: in_flight.release())
+            emit((None, future))
+    
+    async def _parse_text(self, content: BinaryIO) -> Tuple[str, dict]:
+        """Extract text from plain text file"""
+        content = content.read()
+        
+        # Most uploads are UTF-8, which a strict decode confirms cheaply
+        try:
+            return content.decode('utf-8'), {"extraction_method": "text", "encoding": "utf-8"}
+        except UnicodeDecodeError:
+            pass
         
-        # Fallback with error replacement
-        text = content.decode('utf-8', errors='replace')
-        return text, {"extraction_method": "text", "encoding": "utf-8-fallback"}
+        # Otherwise sniff the encoding from the start of the file and decode once
+        encoding = self._detect_encoding(content[:65536])
+        text = content.decode(encoding, errors='replace')
+        return text, {"extraction_method": "text", "encoding": encoding}
     
-    async def _parse_docx(self, content: bytes) -> Tuple[str, dict]:
+    @staticmethod
+    def _detect_encoding(sample: bytes) -> str:
+        """Guess the encoding of a non-UTF-8 byte sample, defaulting to latin-1"""
+        try:
+            from charset_normalizer import from_bytes
+        except ImportError:
+            return 'latin-1'
+        
+        best = from_bytes(sample).best()
+        return best.encoding if best else 'latin-1'
+    
+    async def _parse_docx(self, content: BinaryIO) -> Tuple[str, dict]:
         """Extract text from DOCX file"""
         if not self.docx_available:
             raise RuntimeError("DOCX parsing not available. Install python-docx.")
         
         from docx import Document
         
-        doc = Document(io.BytesIO(content))
+        doc = Document(content)
         
         text_parts = []
         for para in doc.paragraphs:
@@ -147,21 +449,16 @@ class DocumentParser:
         
         return "\n\n".join(text_parts), {"extraction_method": "python-docx"}
     
-    async def _ocr_page(self, page) -> Optional[str]:
-        """Perform OCR on a PDF page"""
-        if not self.ocr_available:
-            return None
-        
+    def _ocr_image(self, image, language: Optional[str] = None) -> Optional[str]:
+        """Perform OCR on a rendered page image (blocking; runs on the OCR pool)"""
         try:
             import pytesseract
-            from PIL import Image
             
-            # Convert page to image
-            image = page.to_image(resolution=300)
-            pil_image = image.original
+            config = self.OCR_CONFIG
+            if language and language in _installed_ocr_languages():
+                config = f"{config} -l {language}"
             
-            # Perform OCR
-            text = pytesseract.image_to_string(pil_image)
+            text = pytesseract.image_to_string(image, config=config)
             return text if text.strip() else None
         except Exception as e:
             logger.warning(f"OCR failed: {e}")
@@ -195,14 +492,12 @@ class DocumentParser:
         Returns:
             Cleaned text
         """
-        import re
-        
         # Normalize line endings
         text = text.replace('\r\n', '\n').replace('\r', '\n')
         
         # Remove excessive whitespace
-        text = re.sub(r'[ \t]+', ' ', text)
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        text = _HORIZONTAL_WS_RE.sub(' ', text)
+        text = _EXCESS_NEWLINES_RE.sub('\n\n', text)
         
         # Strip leading/trailing whitespace from each line
         lines = [line.strip() for line in text.split('\n')]
@@ -221,23 +516,24 @@ class DocumentParser:
         Returns:
             ISO language code (e.g., 'en', 'pt', 'de')
         """
-        # Common words in different languages
-        language_markers = {
-            'en': ['the', 'and', 'is', 'are', 'shall', 'must', 'tax', 'rate', 'income'],
-            'pt': ['o', 'a', 'de', 'da', 'do', 'imposto', 'taxa', 'alíquota', 'renda'],
-            'es': ['el', 'la', 'de', 'del', 'impuesto', 'tasa', 'renta', 'gravamen'],
-            'de': ['der', 'die', 'das', 'und', 'steuer', 'satz', 'einkommen', 'betrag'],
-            'fr': ['le', 'la', 'de', 'du', 'impôt', 'taux', 'revenu', 'taxe'],
-            'it': ['il', 'la', 'di', 'del', 'imposta', 'tasso', 'reddito', 'aliquota'],
-        }
-        
         text_lower = text.lower()
-        words = set(text_lower.split())
+        scores = dict.fromkeys(_LANGUAGE_MARKERS, 0)
         
-        scores = {}
-        for lang, markers in language_markers.items():
-            score = sum(1 for marker in markers if marker in words)
-            scores[lang] = score
+        if _MARKER_AUTOMATON is not None:
+            # Single pass over the text, without splitting it into a set of words;
+            # each marker still counts once however often it appears
+            normalized = text_lower
+            for whitespace in "\n\t\r\f\v":
+                normalized = normalized.replace(whitespace, " ")
+            normalized = f" {normalized} "
+            found = {value for _, value in _MARKER_AUTOMATON.iter(normalized)}
+            for _, languages in found:
+                for lang in languages:
+                    scores[lang] += 1
+        else:
+            words = set(text_lower.split())
+            for lang, markers in _LANGUAGE_MARKERS.items():
+                scores[lang] = sum(1 for marker in markers if marker in words)
         
         # Default to English if no clear winner
         best_lang = max(scores, key=scores.get) if scores else 'en'
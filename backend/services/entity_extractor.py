@@ -6,8 +6,13 @@ Extracts tax entities from documents using AI processing
 import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any, Callable
+import os
+from typing import Optional, Dict, Any, Callable, TypeVar, Union
 from datetime import date
+from functools import lru_cache
+from itertools import chain, count, repeat
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 from models.schemas import (
     ExtractedEntities,
@@ -23,6 +28,95 @@ from services.ai_processor import AIProcessor
 
 logger = logging.getLogger(__name__)
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# Response keys holding lists of entity rows
+_ENTITY_CATEGORIES = ("tax_types", "rates", "brackets", "thresholds", "deadlines", "rules")
+
+# Tax type lookup by value, so unknown model output misses without raising ValueError
+_TAX_TYPE_MAP: dict[str, TaxType] = {t.value: t for t in TaxType}
+
+# _parse_extraction_response coerces and range-checks every field itself, so the
+# entity models may be built with model_construct instead of being re-validated.
+# Off by default: on pydantic-core 2.5 validation is faster than model_construct's
+# Python-level field handling, so only enable this where profiling shows a win.
+_USE_CONSTRUCT = os.getenv("ENTITY_MODEL_CONSTRUCT", "false").lower() == "true"
+
+
+def _build(model: type[ModelT], **fields: Any) -> ModelT:
+    """Create a model from already-coerced fields"""
+    if _USE_CONSTRUCT:
+        return model.model_construct(**fields)
+    return model(**fields)
+
+
+def _unit_rate(value: Any) -> float:
+    """Coerce a rate to float, rejecting values outside [0, 1] as the schema does"""
+    rate = float(value)
+    if not 0 <= rate <= 1:
+        raise ValueError(f"rate {rate} outside [0, 1]")
+    return rate
+
+
+def _optional_float(value: Any) -> Optional[float]:
+    """Coerce a nullable number to float"""
+    return None if value is None else float(value)
+
+
+def _str_or(value: Any, default: str) -> str:
+    """Coerce a value to str, using default only when it is missing (empty strings are kept)"""
+    return default if value is None else str(value)
+
+
+def _optional_int(value: Any) -> Optional[int]:
+    """Coerce a nullable integer the way Pydantic does ("10", "10.0" and 10.0 are 10; 10.5 fails)"""
+    return _OPTIONAL_INT_ADAPTER.validate_python(value)
+
+
+def _optional_str(value: Any) -> Optional[str]:
+    """Coerce a nullable value to str"""
+    return None if value is None else str(value)
+
+
+def _str_list(value: Any) -> list[str]:
+    """Coerce a nullable list to a list of strings"""
+    if not value:
+        return []
+    if not isinstance(value, list):
+        raise ValueError(f"expected a list, got {type(value).__name__}")
+    return [str(item) for item in value]
+
+
+# Scalar validators matching the entity models' field coercion
+_DATE_ADAPTER = TypeAdapter(date)
+_OPTIONAL_INT_ADAPTER = TypeAdapter(Optional[int])
+
+# Placeholders models emit for "no date"; skipped without attempting a parse
+_NULL_DATE_TOKENS = frozenset({"", "null", "none", "n/a", "na", "tbd"})
+
+
+def _is_null_date(date_str: str) -> bool:
+    """Whether a date string is a "no date" placeholder"""
+    return date_str.strip().lower() in _NULL_DATE_TOKENS
+
+
+@lru_cache(maxsize=1024)
+def _parse_iso_date(value: Union[str, int, float]) -> Optional[date]:
+    """
+    Parse a date the way the Pydantic models do (ISO dates, midnight datetimes, Unix
+    timestamps), or None for placeholders and invalid dates. Using the same rules as
+    the single-pass model validation keeps both parsing paths in agreement.
+    Cached (documents repeat the same dates across rules), so it must stay side-effect free
+    """
+    if isinstance(value, str):
+        if _is_null_date(value):
+            return None
+        value = value.strip()
+    try:
+        return _DATE_ADAPTER.validate_python(value)
+    except ValidationError:
+        return None
+
 
 class EntityExtractor:
     """Service for extracting tax entities from document text"""
@@ -35,6 +129,12 @@ class EntityExtractor:
             ai_processor: AI processor instance for LLM calls
         """
         self.ai_processor = ai_processor
+        # Concurrent chunk extractions, bounded to respect provider rate limits
+        self.max_concurrent = int(os.getenv("MAX_CHUNK_CONCURRENCY", "3"))
+        # Responses with more entity rows than this are parsed in a worker thread
+        self.offload_min_entities = int(os.getenv("PARSE_OFFLOAD_MIN_ENTITIES", "200"))
+        # Small chunks packed into one LLM call (1 sends every chunk on its own)
+        self.chunk_batch_size = int(os.getenv("CHUNK_BATCH_SIZE", "1"))
     
     async def extract(
         self,
@@ -55,6 +155,21 @@ class EntityExtractor:
         Returns:
             Tuple of (ExtractedEntities, raw_response)
         """
+        raw_response = await self._request_extraction(document_text, country, language, context)
+        
+        # Parse and validate response
+        entities = await self._parse_extraction_response_async(raw_response)
+        
+        return entities, raw_response
+    
+    async def _request_extraction(
+        self,
+        document_text: str,
+        country: str,
+        language: str,
+        context: Optional[str]
+    ) -> Dict[str, Any]:
+        """Send the extraction prompt for one document and return the raw response dict"""
         # Get prompts
         system_prompt, user_prompt = PromptTemplates.get_entity_extraction_prompt(
             document_text=document_text,
@@ -64,6 +179,31 @@ class EntityExtractor:
         )
         
         # Process with AI
+        return await self.ai_processor.process_with_json_response(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            temperature=0.1,
+            max_tokens=4096
+        )
+    
+    async def extract_batch(
+        self,
+        documents: list[tuple[str, str, str, Optional[str]]]
+    ) -> list[tuple[ExtractedEntities, Dict[str, Any]]]:
+        """
+        Extract tax entities from several small documents with a single LLM call
+        
+        Args:
+            documents: List of (document_text, country, language, context) tuples
+            
+        Returns:
+            List of (ExtractedEntities, raw_response) tuples, in input order
+            
+        Raises:
+            ValueError: If the response does not contain one extraction per document
+        """
+        system_prompt, user_prompt = PromptTemplates.get_entity_extraction_batch_prompt(documents)
+        
         raw_response = await self.ai_processor.process_with_json_response(
             system_prompt=system_prompt,
             user_prompt=user_prompt,
@@ -71,10 +211,26 @@ class EntityExtractor:
             max_tokens=4096
         )
         
-        # Parse and validate response
-        entities = self._parse_extraction_response(raw_response)
+        extractions = raw_response.get("documents")
+        if not isinstance(extractions, list) or len(extractions) != len(documents):
+            raise ValueError(f"Expected {len(documents)} extractions in batch response")
+        if not all(isinstance(item, dict) for item in extractions):
+            raise ValueError("Batch response contains non-object extractions")
         
-        return entities, raw_response
+        return [(self._parse_extraction_response(item), item) for item in extractions]
+    
+    async def _parse_extraction_response_async(self, response: Dict[str, Any]) -> ExtractedEntities:
+        """
+        Parse an AI response, off the event loop for large responses
+        Typical responses parse in well under a millisecond, less than a thread hop costs
+        """
+        rows = sum(
+            len(value) for value in map(response.get, _ENTITY_CATEGORIES)
+            if isinstance(value, list)
+        )
+        if rows < self.offload_min_entities:
+            return self._parse_extraction_response(response)
+        return await asyncio.to_thread(self._parse_extraction_response, response)
     
     def _parse_extraction_response(self, response: Dict[str, Any]) -> ExtractedEntities:
         """
@@ -86,103 +242,67 @@ class EntityExtractor:
         Returns:
             ExtractedEntities object
         """
-        # Parse tax types
-        tax_types = []
-        for tax_type_str in response.get("tax_types", []):
-            try:
-                tax_type = TaxType(tax_type_str.upper())
-                tax_types.append(tax_type)
-            except ValueError:
-                logger.warning(f"Unknown tax type: {tax_type_str}")
-                tax_types.append(TaxType.OTHER)
-        
-        # Parse rates
-        rates = []
-        for rate_data in response.get("rates", []):
-            try:
-                rate = TaxRate(
-                    name=rate_data.get("name", "unknown"),
-                    rate=float(rate_data.get("rate", 0)),
-                    description=rate_data.get("description"),
-                    conditions=rate_data.get("conditions", []),
-                    exemptions=rate_data.get("exemptions", [])
-                )
-                rates.append(rate)
-            except Exception as e:
-                logger.warning(f"Failed to parse rate: {e}")
-        
-        # Parse brackets
-        brackets = []
-        for bracket_data in response.get("brackets", []):
-            try:
-                bracket = TaxBracket(
-                    min_amount=float(bracket_data.get("min_amount", 0)),
-                    max_amount=bracket_data.get("max_amount"),
-                    rate=float(bracket_data.get("rate", 0)),
-                    fixed_amount=bracket_data.get("fixed_amount")
-                )
-                brackets.append(bracket)
-            except Exception as e:
-                logger.warning(f"Failed to parse bracket: {e}")
-        
-        # Parse thresholds
-        thresholds = []
-        for threshold_data in response.get("thresholds", []):
-            try:
-                threshold = TaxThreshold(
-                    name=threshold_data.get("name", "unknown"),
-                    amount=float(threshold_data.get("amount", 0)),
-                    currency=threshold_data.get("currency", "USD"),
-                    description=threshold_data.get("description"),
-                    effective_date=self._parse_date(threshold_data.get("effective_date"))
-                )
-                thresholds.append(threshold)
-            except Exception as e:
-                logger.warning(f"Failed to parse threshold: {e}")
-        
-        # Parse deadlines
-        deadlines = []
-        for deadline_data in response.get("deadlines", []):
-            try:
-                deadline = TaxDeadline(
-                    name=deadline_data.get("name", "unknown"),
-                    deadline_type=deadline_data.get("deadline_type", "filing"),
-                    frequency=deadline_data.get("frequency", "annually"),
-                    day_of_period=deadline_data.get("day_of_period"),
-                    description=deadline_data.get("description")
-                )
-                deadlines.append(deadline)
-            except Exception as e:
-                logger.warning(f"Failed to parse deadline: {e}")
-        
-        # Parse rules
-        rules = []
-        for rule_data in response.get("rules", []):
-            try:
-                # Get tax type
-                tax_type_str = rule_data.get("tax_type", "OTHER")
-                try:
-                    tax_type = TaxType(tax_type_str.upper())
-                except ValueError:
-                    tax_type = TaxType.OTHER
-                
-                rule = TaxRule(
-                    id=rule_data.get("id", f"rule_{len(rules)}"),
-                    name=rule_data.get("name", "unknown"),
-                    description=rule_data.get("description", ""),
-                    tax_type=tax_type,
-                    conditions=rule_data.get("conditions", []),
-                    rate=rule_data.get("rate"),
-                    brackets=None,  # Would need separate parsing
-                    effective_date=self._parse_date(rule_data.get("effective_date")),
-                    expiry_date=self._parse_date(rule_data.get("expiry_date")),
-                    source_reference=rule_data.get("source_reference")
-                )
-                rules.append(rule)
-            except Exception as e:
-                logger.warning(f"Failed to parse rule: {e}")
-        
-        return ExtractedEntities(
+        # Missing, null and empty categories all read as an empty tuple (no per-call
+        # list allocation). Well-formed responses validate in a single pydantic-core
+        # pass; anything it rejects (lower-case enums, out-of-range rates, missing ids)
+        # falls back to the per-row parser, which coerces and drops bad rows
+        try:
+            return ExtractedEntities.model_validate({
+                "tax_types": response.get("tax_types") or (),
+                "rates": response.get("rates") or (),
+                "brackets": response.get("brackets") or (),
+                "thresholds": response.get("thresholds") or (),
+                "deadlines": response.get("deadlines") or (),
+                # Rule brackets are not parsed (see _parse_rule)
+                "rules": [{**rule, "brackets": None} for rule in response.get("rules") or ()],
+                "raw_extractions": {
+                    "summary": response.get("summary", ""),
+                    "confidence_score": response.get("confidence_score", 0.0),
+                    "warnings": response.get("warnings") or []
+                }
+            })
+        except (ValidationError, TypeError) as e:
+            logger.debug(f"Extraction response needs per-row parsing: {e}")
+        
+        # Row failures are collected per category and logged once per response
+        failures: Dict[str, list[str]] = {
+            "tax_type": [], "rate": [], "bracket": [], "threshold": [], "deadline": [], "rule": []
+        }
+        tax_types = [
+            self._parse_tax_type(value, failures["tax_type"]) for value in response.get("tax_types") or ()
+        ]
+        rates = [
+            rate for rate in map(self._parse_rate, response.get("rates") or (), repeat(failures["rate"]))
+            if rate is not None
+        ]
+        brackets = [
+            bracket
+            for bracket in map(self._parse_bracket, response.get("brackets") or (), repeat(failures["bracket"]))
+            if bracket is not None
+        ]
+        thresholds = [
+            threshold
+            for threshold in map(self._parse_threshold, response.get("thresholds") or (), repeat(failures["threshold"]))
+            if threshold is not None
+        ]
+        deadlines = [
+            deadline
+            for deadline in map(self._parse_deadline, response.get("deadlines") or (), repeat(failures["deadline"]))
+            if deadline is not None
+        ]
+        rules = [
+            rule
+            for rule in map(self._parse_rule, response.get("rules") or (), count(), repeat(failures["rule"]))
+            if rule is not None
+        ]
+        
+        failed = {kind: errors for kind, errors in failures.items() if errors}
+        if failed:
+            logger.warning(f"Extraction parse failures: { {kind: len(errors) for kind, errors in failed.items()} }")
+            logger.debug(f"Extraction parse failure details: {failed}")
+        
+        return _build(
+            ExtractedEntities,
             tax_types=tax_types,
             rates=rates,
             brackets=brackets,
@@ -192,28 +312,134 @@ class EntityExtractor:
             raw_extractions={
                 "summary": response.get("summary", ""),
                 "confidence_score": response.get("confidence_score", 0.0),
-                "warnings": response.get("warnings", [])
+                "warnings": response.get("warnings") or []
             }
         )
     
-    def _parse_date(self, date_str: Optional[str]) -> Optional[date]:
+    @staticmethod
+    def _parse_tax_type(value: Any, failures: Optional[list[str]] = None) -> TaxType:
+        """Map a tax type string to TaxType, defaulting to OTHER (recorded in failures if given)"""
+        if isinstance(value, str):
+            tax_type = _TAX_TYPE_MAP.get(value.upper())
+            if tax_type is not None:
+                return tax_type
+        if failures is not None:
+            failures.append(f"unknown tax type {value!r}")
+        return TaxType.OTHER
+    
+    def _parse_rate(self, rate_data: Any, failures: list[str]) -> Optional[TaxRate]:
+        """Parse one rate row, or None (recording why in failures) if it is malformed"""
+        if not isinstance(rate_data, dict):
+            failures.append(f"expected an object, got {type(rate_data).__name__}")
+            return None
+        try:
+            return _build(
+                TaxRate,
+                name=_str_or(rate_data.get("name"), "unknown"),
+                rate=_unit_rate(rate_data.get("rate", 0)),
+                description=_optional_str(rate_data.get("description")),
+                conditions=_str_list(rate_data.get("conditions")),
+                exemptions=_str_list(rate_data.get("exemptions"))
+            )
+        except (TypeError, ValueError) as e:
+            failures.append(str(e))
+            return None
+    
+    def _parse_bracket(self, bracket_data: Any, failures: list[str]) -> Optional[TaxBracket]:
+        """Parse one bracket row, or None (recording why in failures) if it is malformed"""
+        if not isinstance(bracket_data, dict):
+            failures.append(f"expected an object, got {type(bracket_data).__name__}")
+            return None
+        try:
+            min_amount = float(bracket_data.get("min_amount", 0))
+            if min_amount < 0:
+                raise ValueError(f"negative min_amount {min_amount}")
+            return _build(
+                TaxBracket,
+                min_amount=min_amount,
+                max_amount=_optional_float(bracket_data.get("max_amount")),
+                rate=_unit_rate(bracket_data.get("rate", 0)),
+                fixed_amount=_optional_float(bracket_data.get("fixed_amount"))
+            )
+        except (TypeError, ValueError) as e:
+            failures.append(str(e))
+            return None
+    
+    def _parse_threshold(self, threshold_data: Any, failures: list[str]) -> Optional[TaxThreshold]:
+        """Parse one threshold row, or None (recording why in failures) if it is malformed"""
+        if not isinstance(threshold_data, dict):
+            failures.append(f"expected an object, got {type(threshold_data).__name__}")
+            return None
+        try:
+            return _build(
+                TaxThreshold,
+                name=_str_or(threshold_data.get("name"), "unknown"),
+                amount=float(threshold_data.get("amount", 0)),
+                currency=_str_or(threshold_data.get("currency"), "USD"),
+                description=_optional_str(threshold_data.get("description")),
+                effective_date=self._parse_date(threshold_data.get("effective_date"))
+            )
+        except (TypeError, ValueError) as e:
+            failures.append(str(e))
+            return None
+    
+    def _parse_deadline(self, deadline_data: Any, failures: list[str]) -> Optional[TaxDeadline]:
+        """Parse one deadline row, or None (recording why in failures) if it is malformed"""
+        if not isinstance(deadline_data, dict):
+            failures.append(f"expected an object, got {type(deadline_data).__name__}")
+            return None
+        try:
+            return _build(
+                TaxDeadline,
+                name=_str_or(deadline_data.get("name"), "unknown"),
+                deadline_type=_str_or(deadline_data.get("deadline_type"), "filing"),
+                frequency=_str_or(deadline_data.get("frequency"), "annually"),
+                day_of_period=_optional_int(deadline_data.get("day_of_period")),
+                description=_optional_str(deadline_data.get("description"))
+            )
+        except (TypeError, ValueError) as e:
+            failures.append(str(e))
+            return None
+    
+    def _parse_rule(self, rule_data: Any, index: int, failures: list[str]) -> Optional[TaxRule]:
+        """Parse one rule row, or None (recording why in failures); index names rules without an id"""
+        if not isinstance(rule_data, dict):
+            failures.append(f"expected an object, got {type(rule_data).__name__}")
+            return None
+        try:
+            return _build(
+                TaxRule,
+                id=_str_or(rule_data.get("id"), f"rule_{index}"),
+                name=_str_or(rule_data.get("name"), "unknown"),
+                description=_str_or(rule_data.get("description"), ""),
+                tax_type=self._parse_tax_type(rule_data.get("tax_type", "OTHER")),
+                conditions=_str_list(rule_data.get("conditions")),
+                rate=_optional_float(rule_data.get("rate")),
+                brackets=None,  # Would need separate parsing
+                effective_date=self._parse_date(rule_data.get("effective_date")),
+                expiry_date=self._parse_date(rule_data.get("expiry_date")),
+                source_reference=_optional_str(rule_data.get("source_reference"))
+            )
+        except (TypeError, ValueError) as e:
+            failures.append(str(e))
+            return None
+    
+    def _parse_date(self, date_str: Any) -> Optional[date]:
         """
         Parse date string to date object
         
         Args:
-            date_str: Date string in YYYY-MM-DD format
+            date_str: Date string in YYYY-MM-DD format (or a timestamp, as Pydantic accepts)
             
         Returns:
             date object or None
         """
-        if not date_str or date_str.lower() == "null":
+        if not isinstance(date_str, (str, int, float)) or isinstance(date_str, bool) or date_str == "":
             return None
-        
-        try:
-            return date.fromisoformat(date_str)
-        except ValueError:
+        parsed = _parse_iso_date(date_str)
+        if parsed is None and not (isinstance(date_str, str) and _is_null_date(date_str)):
             logger.warning(f"Invalid date format: {date_str}")
-            return None
+        return parsed
     
     async def extract_from_chunks(
         self,
@@ -223,7 +449,7 @@ class EntityExtractor:
         context: Optional[str] = None,
         progress_callback: Optional[Callable[[int, int, str], None]] = None,
         parallel: bool = True,
-        max_concurrent: int = 3
+        max_concurrent: Optional[int] = None
     ) -> tuple[ExtractedEntities, list[Dict[str, Any]]]:
         """
         Extract entities from multiple document chunks and merge results
@@ -236,18 +462,34 @@ class EntityExtractor:
             context: Additional context
             progress_callback: Optional callback(current, total, status) for progress updates
             parallel: Whether to process chunks in parallel (default: True)
-            max_concurrent: Maximum concurrent chunk processing (default: 3)
+            max_concurrent: Maximum concurrent chunk processing (default: MAX_CHUNK_CONCURRENCY env, 3)
             
         Returns:
-            Tuple of (merged ExtractedEntities, list of raw responses)
+            Tuple of (merged ExtractedEntities, list of raw responses, one per distinct chunk)
         """
+        max_concurrent = max_concurrent or self.max_concurrent
+        
+        # Identical chunks (repeated headers, boilerplate sections) produce identical
+        # extractions, so send each distinct chunk to the LLM only once
+        unique_chunks = list(dict.fromkeys(chunks))
+        if len(unique_chunks) < len(chunks):
+            logger.info(f"Skipping {len(chunks) - len(unique_chunks)} duplicate chunks")
+        chunks = unique_chunks
+        
         total_chunks = len(chunks)
         logger.info(f"Processing {total_chunks} chunks (parallel={parallel}, max_concurrent={max_concurrent})")
         
         if progress_callback:
             progress_callback(0, total_chunks, "Starting chunk processing...")
         
-        if parallel and total_chunks > 1:
+        if parallel and total_chunks > 1 and self.chunk_batch_size > 1:
+            # Pack small chunks into shared LLM calls, batches in parallel
+            all_results = await self.extract_batched(
+                chunks, country, language, context,
+                batch_size=self.chunk_batch_size, max_concurrent=max_concurrent,
+                progress_callback=progress_callback
+            )
+        elif parallel and total_chunks > 1:
             # Process chunks in parallel with concurrency limit
             all_results = await self._process_chunks_parallel(
                 chunks, country, language, context, progress_callback, max_concurrent
@@ -322,38 +564,114 @@ class EntityExtractor:
         completed = [0]  # Use list for mutability in nested function
         
         async def process_with_semaphore(i: int, chunk: str):
+            chunk_context = f"{context or ''} [Chunk {i+1} of {total}]"
+            try:
+                # Only the LLM call holds a slot; parsing happens after release so the
+                # next chunk's request goes out while this response is being parsed
+                async with semaphore:
+                    response = await self._request_extraction(chunk, country, language, chunk_context)
+                result = (await self._parse_extraction_response_async(response), response)
+            except Exception as e:
+                logger.error(f"Failed to process chunk {i+1}: {e}")
+                result = (ExtractedEntities(
+                    tax_types=[], rates=[], brackets=[], thresholds=[],
+                    deadlines=[], rules=[], raw_extractions={"error": str(e)}
+                ), {"error": str(e)})
+            
+            completed[0] += 1
+            if progress_callback:
+                progress_callback(completed[0], total, f"Processed chunk {i+1} ({completed[0]}/{total})")
+            
+            return result
+        
+        # Each chunk is parsed as soon as its own response arrives; gather then returns
+        # results in chunk order (which first-wins merging depends on), not finish order
+        return await asyncio.gather(
+            *[process_with_semaphore(i, chunk) for i, chunk in enumerate(chunks)]
+        )
+    
+    async def extract_batched(
+        self,
+        chunks: list[str],
+        country: str,
+        language: str = "en",
+        context: Optional[str] = None,
+        batch_size: int = 4,
+        max_batch_chars: int = 8000,
+        max_concurrent: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int, str], None]] = None
+    ) -> list[tuple[ExtractedEntities, Dict[str, Any]]]:
+        """
+        Extract entities from chunks, packing consecutive small chunks into one LLM call
+        
+        Args:
+            chunks: List of document text chunks
+            country: ISO country code
+            language: Document language
+            context: Additional context
+            batch_size: Maximum chunks per LLM call
+            max_batch_chars: Maximum combined chunk length per call; larger chunks go alone
+            max_concurrent: Maximum concurrent LLM calls (default: MAX_CHUNK_CONCURRENCY env, 3)
+            progress_callback: Optional callback(current, total, status), called as each batch completes
+            
+        Returns:
+            List of (ExtractedEntities, raw_response) tuples, one per chunk in input order
+        """
+        total = len(chunks)
+        documents = [
+            (chunk, country, language, f"{context or ''} [Chunk {i+1} of {total}]")
+            for i, chunk in enumerate(chunks)
+        ]
+        
+        batches = []
+        current = []
+        current_chars = 0
+        for document in documents:
+            size = len(document[0])
+            if current and (len(current) >= batch_size or current_chars + size > max_batch_chars):
+                batches.append(current)
+                current, current_chars = [], 0
+            current.append(document)
+            current_chars += size
+        if current:
+            batches.append(current)
+        
+        logger.info(f"Extracting {total} chunks in {len(batches)} batched calls")
+        semaphore = asyncio.Semaphore(max_concurrent or self.max_concurrent)
+        completed = [0]  # Use list for mutability in nested function
+        
+        async def process_batch(batch: list[tuple[str, str, str, str]]):
             async with semaphore:
-                chunk_context = f"{context or ''} [Chunk {i+1} of {total}]"
-                try:
-                    entities, response = await self.extract(
-                        document_text=chunk,
-                        country=country,
-                        language=language,
-                        context=chunk_context
-                    )
-                    result = (entities, response)
-                except Exception as e:
-                    logger.error(f"Failed to process chunk {i+1}: {e}")
-                    result = (ExtractedEntities(
-                        tax_types=[], rates=[], brackets=[], thresholds=[],
-                        deadlines=[], rules=[], raw_extractions={"error": str(e)}
-                    ), {"error": str(e)})
-                
-                completed[0] += 1
-                if progress_callback:
-                    progress_callback(completed[0], total, f"Processed chunk {i+1} ({completed[0]}/{total})")
-                
-                return i, result
-        
-        # Create tasks for all chunks
-        tasks = [process_with_semaphore(i, chunk) for i, chunk in enumerate(chunks)]
-        
-        # Wait for all to complete
-        results_with_indices = await asyncio.gather(*tasks)
-        
-        # Sort by original index and return just the results
-        sorted_results = sorted(results_with_indices, key=lambda x: x[0])
-        return [r[1] for r in sorted_results]
+                results = None
+                if len(batch) > 1:
+                    try:
+                        results = await self.extract_batch(batch)
+                    except Exception as e:
+                        logger.warning(f"Batched chunk extraction failed, falling back to per-chunk calls: {e}")
+                if results is None:
+                    results = [await self._extract_or_error(*document) for document in batch]
+            
+            completed[0] += len(batch)
+            if progress_callback:
+                progress_callback(completed[0], total, f"Processed {len(batch)} chunks ({completed[0]}/{total})")
+            
+            return results
+        
+        results = await asyncio.gather(*[process_batch(batch) for batch in batches])
+        return [result for batch_results in results for result in batch_results]
+    
+    async def _extract_or_error(
+        self, document_text: str, country: str, language: str, context: Optional[str]
+    ) -> tuple[ExtractedEntities, Dict[str, Any]]:
+        """Extract one chunk, turning a failure into an empty extraction carrying the error"""
+        try:
+            return await self.extract(document_text, country, language, context)
+        except Exception as e:
+            logger.error(f"Failed to process chunk: {e}")
+            return ExtractedEntities(
+                tax_types=[], rates=[], brackets=[], thresholds=[],
+                deadlines=[], rules=[], raw_extractions={"error": str(e)}
+            ), {"error": str(e)}
     
     def _merge_entities(self, entities_list: list[ExtractedEntities]) -> ExtractedEntities:
         """
@@ -365,65 +683,41 @@ class EntityExtractor:
         Returns:
             Merged ExtractedEntities
         """
-        merged = ExtractedEntities(
-            tax_types=[],
-            rates=[],
-            brackets=[],
-            thresholds=[],
-            deadlines=[],
-            rules=[],
-            raw_extractions={}
-        )
-        
-        seen_tax_types = set()
-        seen_rate_names = set()
-        seen_threshold_names = set()
-        seen_deadline_names = set()
-        seen_rule_ids = set()
+        # Dicts keyed by the dedup field keep the first occurrence in insertion order
+        rates = {}
+        thresholds = {}
+        deadlines = {}
+        rules = {}
+        raw_extractions = {}
         
         for entities in entities_list:
-            # Merge tax types (unique)
-            for tax_type in entities.tax_types:
-                if tax_type not in seen_tax_types:
-                    merged.tax_types.append(tax_type)
-                    seen_tax_types.add(tax_type)
-            
-            # Merge rates (unique by name)
             for rate in entities.rates:
-                if rate.name not in seen_rate_names:
-                    merged.rates.append(rate)
-                    seen_rate_names.add(rate.name)
-            
-            # Merge brackets (all)
-            merged.brackets.extend(entities.brackets)
-            
-            # Merge thresholds (unique by name)
+                rates.setdefault(rate.name, rate)
             for threshold in entities.thresholds:
-                if threshold.name not in seen_threshold_names:
-                    merged.thresholds.append(threshold)
-                    seen_threshold_names.add(threshold.name)
-            
-            # Merge deadlines (unique by name)
+                thresholds.setdefault(threshold.name, threshold)
             for deadline in entities.deadlines:
-                if deadline.name not in seen_deadline_names:
-                    merged.deadlines.append(deadline)
-                    seen_deadline_names.add(deadline.name)
-            
-            # Merge rules (unique by ID)
+                deadlines.setdefault(deadline.name, deadline)
             for rule in entities.rules:
-                if rule.id not in seen_rule_ids:
-                    merged.rules.append(rule)
-                    seen_rule_ids.add(rule.id)
+                rules.setdefault(rule.id, rule)
             
             # Merge raw extractions
             for key, value in entities.raw_extractions.items():
-                if key not in merged.raw_extractions:
-                    merged.raw_extractions[key] = value
+                if key not in raw_extractions:
+                    raw_extractions[key] = value
                 elif isinstance(value, list):
-                    if isinstance(merged.raw_extractions[key], list):
-                        merged.raw_extractions[key].extend(value)
-        
-        return merged
+                    if isinstance(raw_extractions[key], list):
+                        raw_extractions[key].extend(value)
+        
+        # Every item is already a parsed model, so skip re-validating the merged lists
+        return ExtractedEntities.model_construct(
+            tax_types=list(dict.fromkeys(chain.from_iterable(e.tax_types for e in entities_list))),
+            rates=list(rates.values()),
+            brackets=list(chain.from_iterable(e.brackets for e in entities_list)),
+            thresholds=list(thresholds.values()),
+            deadlines=list(deadlines.values()),
+            rules=list(rules.values()),
+            raw_extractions=raw_extractions
+        )
     
     def validate_entities(self, entities: ExtractedEntities) -> list[str]:
         """
@@ -437,12 +731,18 @@ class EntityExtractor:
         """
         warnings = []
         
-        # Check for rates outside normal range
+        # Check for rates outside normal range, collecting duplicate names in the same pass
+        rate_names = set()
+        duplicate_rate_names = {}
         for rate in entities.rates:
             if rate.rate > 0.5:
                 warnings.append(f"Unusually high rate detected: {rate.name} = {rate.rate*100}%")
             if rate.rate < 0:
                 warnings.append(f"Negative rate detected: {rate.name} = {rate.rate*100}%")
+            if rate.name in rate_names:
+                duplicate_rate_names[rate.name] = None
+            else:
+                rate_names.add(rate.name)
         
         # Check for brackets with invalid ranges
         for i, bracket in enumerate(entities.brackets):
@@ -455,8 +755,21 @@ class EntityExtractor:
                 warnings.append(f"Rule '{rule.id}' missing description")
         
         # Check for duplicate names
-        rate_names = [r.name for r in entities.rates]
-        if len(rate_names) != len(set(rate_names)):
-            warnings.append("Duplicate rate names detected")
+        for name in duplicate_rate_names:
+            warnings.append(f"Duplicate rate name detected: {name}")
+        for label, keys in (
+            ("threshold name", (t.name for t in entities.thresholds)),
+            ("deadline name", (d.name for d in entities.deadlines)),
+            ("rule ID", (r.id for r in entities.rules)),
+        ):
+            seen = set()
+            duplicates = {}
+            for key in keys:
+                if key in seen:
+                    duplicates[key] = None
+                else:
+                    seen.add(key)
+            for key in duplicates:
+                warnings.append(f"Duplicate {label} detected: {key}")
         
         return warnings
@@ -3,9 +3,9 @@ Output Generator Service
 Generates JSON configs, SQL migrations, policy definitions, and code
 """
 
-import json
+import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 
 from models.schemas import (
@@ -24,22 +24,41 @@ class OutputGenerator:
     def __init__(self, ai_processor: AIProcessor):
         self.ai_processor = ai_processor
     
+    @staticmethod
+    def serialize_entities(entities: ExtractedEntities) -> str:
+        """Serialize extracted entities into the JSON embedded in generation prompts"""
+        return entities.model_dump_json(indent=2)
+    
     async def generate_all(
         self, entities: ExtractedEntities, country: str, country_name: str
     ) -> Dict[str, Any]:
         """Generate all output formats"""
-        results = {}
-        results["json_config"] = await self.generate_json_config(entities, country, country_name)
-        results["sql_migration"] = await self.generate_sql_migration(entities, country, country_name)
-        results["policy_definition"] = await self.generate_policy_definition(entities, country, country_name)
-        results["generated_code"] = await self.generate_code(entities, country, country_name)
-        return results
+        # Serialize the entities once for all four prompts, then run the
+        # independent generations concurrently
+        entities_json = self.serialize_entities(entities)
+        json_config, sql_migration, policy_definition, generated_code = await asyncio.gather(
+            self.generate_json_config(entities, country, country_name, entities_json),
+            self.generate_sql_migration(entities, country, country_name, entities_json),
+            self.generate_policy_definition(entities, country, country_name, entities_json),
+            self.generate_code(entities, country, country_name, entities_json)
+        )
+        return {
+            "json_config": json_config,
+            "sql_migration": sql_migration,
+            "policy_definition": policy_definition,
+            "generated_code": generated_code
+        }
     
     async def generate_json_config(
-        self, entities: ExtractedEntities, country: str, country_name: str
+        self,
+        entities: ExtractedEntities,
+        country: str,
+        country_name: str,
+        entities_json: Optional[str] = None
     ) -> JSONConfig:
         """Generate JSON configuration"""
-        entities_json = json.dumps(entities.model_dump(), default=str, indent=2)
+        if entities_json is None:
+            entities_json = self.serialize_entities(entities)
         system_prompt, user_prompt = PromptTemplates.get_json_config_prompt(
             entities_json=entities_json, country=country, country_name=country_name
         )
@@ -63,14 +82,19 @@ class OutputGenerator:
             effective_date=None,
             currency=response.get("currency", "USD"),
             rules=response.get("rules", []),
-            metadata=response.get("metadata", {"generated_at": datetime.utcnow().isoformat()})
+            metadata=response.get("metadata", {"generated_at": datetime.now(timezone.utc).isoformat()})
         )
     
     async def generate_sql_migration(
-        self, entities: ExtractedEntities, country: str, country_name: str
+        self,
+        entities: ExtractedEntities,
+        country: str,
+        country_name: str,
+        entities_json: Optional[str] = None
     ) -> SQLMigration:
         """Generate SQL migration scripts"""
-        entities_json = json.dumps(entities.model_dump(), default=str, indent=2)
+        if entities_json is None:
+            entities_json = self.serialize_entities(entities)
         system_prompt, user_prompt = PromptTemplates.get_sql_migration_prompt(
             entities_json=entities_json, country=country, country_name=country_name
         )
@@ -82,7 +106,7 @@ class OutputGenerator:
     def _parse_sql_migration(self, response: Dict) -> SQLMigration:
         """Parse AI response into SQLMigration"""
         return SQLMigration(
-            migration_name=response.get("migration_name", f"migration_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"),
+            migration_name=response.get("migration_name", f"migration_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"),
             up_script=response.get("up_script", "-- No migration generated"),
             down_script=response.get("down_script", "-- No rollback generated"),
             tables_affected=response.get("tables_affected", []),
@@ -90,10 +114,15 @@ class OutputGenerator:
         )
     
     async def generate_policy_definition(
-        self, entities: ExtractedEntities, country: str, country_name: str
+        self,
+        entities: ExtractedEntities,
+        country: str,
+        country_name: str,
+        entities_json: Optional[str] = None
     ) -> PolicyDefinition:
         """Generate policy/rules engine definition"""
-        entities_json = json.dumps(entities.model_dump(), default=str, indent=2)
+        if entities_json is None:
+            entities_json = self.serialize_entities(entities)
         system_prompt, user_prompt = PromptTemplates.get_policy_definition_prompt(
             entities_json=entities_json, country=country, country_name=country_name
         )
@@ -113,10 +142,15 @@ class OutputGenerator:
         )
     
     async def generate_code(
-        self, entities: ExtractedEntities, country: str, country_name: str
+        self,
+        entities: ExtractedEntities,
+        country: str,
+        country_name: str,
+        entities_json: Optional[str] = None
     ) -> GeneratedCode:
         """Generate Python code for tax calculations"""
-        entities_json = json.dumps(entities.model_dump(), default=str, indent=2)
+        if entities_json is None:
+            entities_json = self.serialize_entities(entities)
         system_prompt, user_prompt = PromptTemplates.get_code_generation_prompt(
             entities_json=entities_json, country=country, country_name=country_name
         )
@@ -0,0 +1,257 @@
+"""
+Processing Pipeline Service
+Shared extract -> validate -> generate pipeline behind the processing endpoints
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import BrokenExecutor, Executor
+from typing import Optional, Dict, Any, Awaitable, Callable, TypeVar
+
+from models.schemas import ExtractedEntities, OutputFormat, ProcessingResult
+from services.ai_processor import AIProcessor
+from services.cache import ResponseCache
+from services.document_parser import DocumentParser
+from services.entity_extractor import EntityExtractor
+from services.output_generator import OutputGenerator
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ProcessingPipeline:
+    """Runs cleaned document text through extraction and output generation"""
+
+    # Human-readable names used in generation warnings
+    OUTPUT_LABELS = {
+        "json_config": "JSON config",
+        "sql_migration": "SQL migration",
+        "policy_definition": "Policy definition",
+        "generated_code": "Code",
+    }
+
+    def __init__(
+        self,
+        document_parser: DocumentParser,
+        ai_processor: AIProcessor,
+        entity_extractor: EntityExtractor,
+        output_generator: OutputGenerator,
+        response_cache: ResponseCache,
+        text_executor: Optional[Executor] = None,
+        text_executor_factory: Optional[Callable[[], Executor]] = None,
+        offload_min_chars: int = 10_000,
+        chunk_token_threshold: int = 6000,
+        default_confidence: float = 0.8
+    ):
+        """
+        Initialize Processing Pipeline
+
+        Args:
+            document_parser: Parser used for text cleaning and language detection
+            ai_processor: AI processor instance for token counting and chunking
+            entity_extractor: Extractor for tax entities
+            output_generator: Generator for the output formats
+            response_cache: Cache for extraction and generation results
+            text_executor: Executor for CPU-bound text processing on large inputs
+            text_executor_factory: Builds a replacement when text_executor breaks
+                (e.g. a worker process died); without it, text is processed inline from then on
+            offload_min_chars: Texts shorter than this are processed inline
+            chunk_token_threshold: Documents above this many tokens are chunked
+            default_confidence: Confidence reported when the model returns none
+        """
+        self.document_parser = document_parser
+        self.ai_processor = ai_processor
+        self.entity_extractor = entity_extractor
+        self.output_generator = output_generator
+        self.response_cache = response_cache
+        self.text_executor = text_executor
+        self.text_executor_factory = text_executor_factory
+        self.offload_min_chars = offload_min_chars
+        self.chunk_token_threshold = chunk_token_threshold
+        self.default_confidence = default_confidence
+
+    async def run_text_task(self, func: Callable[[str], T], text: str) -> T:
+        """
+        Run a CPU-bound text function off the event loop for large inputs
+        Small inputs stay inline, where executor/IPC overhead would dominate
+        """
+        executor = self.text_executor
+        if executor is None or len(text) < self.offload_min_chars:
+            return func(text)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, func, text)
+        except BrokenExecutor as e:
+            logger.warning(f"Text executor is broken ({e}); processing inline and replacing it")
+            self._replace_text_executor(executor)
+            return func(text)
+    
+    def _replace_text_executor(self, broken: Executor):
+        """Swap out a broken text executor (once, however many tasks saw it break)"""
+        if self.text_executor is not broken:
+            return
+        self.text_executor = self.text_executor_factory() if self.text_executor_factory else None
+        broken.shutdown(wait=False, cancel_futures=True)
+    
+    def shutdown(self):
+        """Stop the text executor's workers"""
+        if self.text_executor is not None:
+            self.text_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def clean_text(self, text: str) -> str:
+        """Clean raw document text"""
+        return await self.run_text_task(self.document_parser.clean_text, text)
+
+    async def analyze(
+        self, text: str, country: str, language: Optional[str], context: Optional[str]
+    ) -> tuple[str, str, ExtractedEntities]:
+        """
+        Detect language and extract entities from a document, chunking large ones
+
+        Args:
+            text: Cleaned document text
+            country: ISO country code
+            language: Document language (detected if not provided)
+            context: Additional context
+
+        Returns:
+            Tuple of (language, cache_key, entities)
+        """
+        # Detect language (if not provided) off the event loop while checking
+        # whether the document is too large and needs chunking
+        if language:
+            needs_chunking = await self.ai_processor.exceeds_token_limit(text, self.chunk_token_threshold)
+        else:
+            language, needs_chunking = await asyncio.gather(
+                self.run_text_task(self.document_parser.detect_language, text),
+                self.ai_processor.exceeds_token_limit(text, self.chunk_token_threshold)
+            )
+
+        cache_key = ResponseCache.make_key(text, country, language, context)
+
+        async def extract_entities():
+            if needs_chunking:
+                # Chunk the document
+                chunks = await self.ai_processor.chunk_text(text, max_tokens=self.chunk_token_threshold)
+                return await self.entity_extractor.extract_from_chunks(
+                    chunks=chunks, country=country, language=language, context=context
+                )
+            # Process as single document
+            return await self.entity_extractor.extract(
+                document_text=text, country=country, language=language, context=context
+            )
+
+        entities, raw_responses = await self.response_cache.get_or_compute(
+            f"extract:{cache_key}", extract_entities
+        )
+        return language, cache_key, entities
+
+    def output_tasks(
+        self,
+        output_format: OutputFormat,
+        entities: ExtractedEntities,
+        country: str,
+        country_name: str,
+        cache_key: str
+    ) -> Dict[str, Awaitable[Any]]:
+        """Build the (cached) output generation coroutines for the requested format, keyed by output name"""
+        generator = self.output_generator
+        # Serialized once and shared by every generation prompt
+        entities_json = generator.serialize_entities(entities)
+        tasks = {}
+        if output_format in [OutputFormat.ALL, OutputFormat.JSON]:
+            tasks["json_config"] = self.response_cache.get_or_compute(
+                f"json_config:{cache_key}",
+                lambda: generator.generate_json_config(entities, country, country_name, entities_json)
+            )
+        if output_format in [OutputFormat.ALL, OutputFormat.SQL]:
+            tasks["sql_migration"] = self.response_cache.get_or_compute(
+                f"sql_migration:{cache_key}",
+                lambda: generator.generate_sql_migration(entities, country, country_name, entities_json)
+            )
+        if output_format in [OutputFormat.ALL, OutputFormat.YAML]:
+            tasks["policy_definition"] = self.response_cache.get_or_compute(
+                f"policy_definition:{cache_key}",
+                lambda: generator.generate_policy_definition(entities, country, country_name, entities_json)
+            )
+        if output_format in [OutputFormat.ALL, OutputFormat.CODE]:
+            tasks["generated_code"] = self.response_cache.get_or_compute(
+                f"generated_code:{cache_key}",
+                lambda: generator.generate_code(entities, country, country_name, entities_json)
+            )
+        return tasks
+
+    async def run(
+        self,
+        text: str,
+        country: str,
+        language: Optional[str],
+        context: Optional[str],
+        output_format: OutputFormat,
+        document_id: str,
+        start_time: float,
+        default_summary: str = "Document processed successfully"
+    ) -> ProcessingResult:
+        """
+        Run the full pipeline on cleaned text
+
+        Args:
+            text: Cleaned document text
+            country: ISO country code
+            language: Document language (detected if not provided)
+            context: Additional context
+            output_format: Requested output format(s)
+            document_id: Identifier reported in the result
+            start_time: Request start time, for processing_time_ms
+            default_summary: Summary used when the model returns none
+
+        Returns:
+            ProcessingResult with entities and generated outputs
+        """
+        country_code = country.upper()
+        country_name = self.ai_processor.get_country_name(country_code)
+
+        language, cache_key, entities = await self.analyze(text, country, language, context)
+
+        # Validate entities
+        warnings = self.entity_extractor.validate_entities(entities)
+
+        # Generate outputs concurrently - handle failures gracefully
+        tasks = self.output_tasks(output_format, entities, country_code, country_name, cache_key)
+        outputs = {}
+        generation_errors = []
+        if tasks:
+            names, coros = zip(*tasks.items())
+            results = await asyncio.gather(*coros, return_exceptions=True)
+            for name, result in zip(names, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"{self.OUTPUT_LABELS[name]} generation failed: {result}")
+                    generation_errors.append(f"{self.OUTPUT_LABELS[name]} generation failed: {str(result)}")
+                    outputs[name] = None
+                else:
+                    outputs[name] = result
+
+        # Add generation errors to warnings
+        warnings = warnings + entities.raw_extractions.get("warnings", []) + generation_errors
+
+        processing_time = int((time.time() - start_time) * 1000)
+
+        return ProcessingResult(
+            success=True,
+            document_id=document_id,
+            country=country_code,
+            country_name=country_name,
+            language_detected=language,
+            processing_time_ms=processing_time,
+            summary=entities.raw_extractions.get("summary", default_summary),
+            entities=entities,
+            json_config=outputs.get("json_config"),
+            sql_migration=outputs.get("sql_migration"),
+            policy_definition=outputs.get("policy_definition"),
+            generated_code=outputs.get("generated_code"),
+            confidence_score=entities.raw_extractions.get("confidence_score", self.default_confidence),
+            warnings=warnings,
+            source_sections=[]
+        )
@@ -0,0 +1,28 @@
+"""JSON recovery from LLM responses with surrounding text"""
+
+from services.ai_processor import MockAIProcessor
+
+
+def test_extract_json_prefers_outermost_object():
+    processor = MockAIProcessor()
+    text = 'Sure, "here" it is: {"rates": [{"rate": 19}], "note": "use {braces}"} Done.'
+
+    assert processor._extract_json(text) == '{"rates": [{"rate": 19}], "note": "use {braces}"}'
+
+
+def test_extract_json_falls_back_to_inner_and_later_objects():
+    processor = MockAIProcessor()
+
+    # Unclosed outer brace: the nested object is still recovered
+    assert processor._extract_json('{"broken": {"rate": 19}') == '{"rate": 19}'
+    # Invalid first object: the next balanced one is used
+    assert processor._extract_json('{not json} then {"rate": 7}') == '{"rate": 7}'
+    # Stdlib-only JSON (NaN) is accepted
+    assert processor._extract_json('x {"rate": NaN} y') == '{"rate": NaN}'
+    assert processor._extract_json("no json here") is None
+
+
+def test_extract_json_is_linear_on_unbalanced_input():
+    processor = MockAIProcessor()
+
+    assert processor._extract_json("{" * 200_000) is None
@@ -0,0 +1,43 @@
+"""Single-flight behaviour of the response cache"""
+
+import asyncio
+
+import pytest
+
+from services.cache import ResponseCache
+
+
+def test_waiters_keep_single_flight_after_failed_compute():
+    async def main():
+        cache = ResponseCache()
+        calls = []
+        running = asyncio.Event()
+        release = asyncio.Event()
+
+        async def failing():
+            calls.append("fail")
+            running.set()
+            await release.wait()
+            raise RuntimeError("boom")
+
+        async def slow():
+            calls.append("slow")
+            await asyncio.sleep(0.05)
+            return "value"
+
+        first = asyncio.create_task(cache.get_or_compute("k", failing))
+        await running.wait()
+        waiters = [asyncio.create_task(cache.get_or_compute("k", slow)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+
+        with pytest.raises(RuntimeError):
+            await first
+        # A request arriving while the waiters are still queued must share their lock
+        late = asyncio.create_task(cache.get_or_compute("k", slow))
+
+        assert await asyncio.gather(*waiters, late) == ["value"] * 4
+        assert calls == ["fail", "slow"]
+        assert cache._locks == {}
+
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""Shutdown of the background request dispatchers"""
+
+import asyncio
+
+import pytest
+
+from services.ai_processor import MockAIProcessor
+from services.batch_extractor import BatchingEntityExtractor
+
+
+async def slow_process(*args, **kwargs) -> str:
+    await asyncio.sleep(10)
+    return "{}"
+
+
+async def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def other_tasks() -> set:
+    return asyncio.all_tasks() - {asyncio.current_task()}
+
+
+def test_ai_processor_aclose_fails_waiting_submissions():
+    async def main():
+        processor = MockAIProcessor()
+        processor.batch_window = 0.5
+        processor.process = slow_process
+        processor.estimate_tokens = estimate_tokens
+
+        # One request already dispatched, one still inside the collection window
+        dispatched = asyncio.create_task(processor.submit("system", "short"))
+        await asyncio.sleep(0.6)
+        collecting = asyncio.create_task(processor.submit("system", "short"))
+        await asyncio.sleep(0.05)
+
+        await processor.aclose()
+        for task in (dispatched, collecting):
+            with pytest.raises(RuntimeError, match="shut down"):
+                await task
+        assert not other_tasks()
+
+    asyncio.run(main())
+
+
+def test_batching_extractor_aclose_fails_waiting_extractions():
+    async def main():
+        processor = MockAIProcessor()
+        processor.process = slow_process
+        extractor = BatchingEntityExtractor(processor, window_ms=500)
+
+        dispatched = asyncio.create_task(extractor.extract("VAT is 19%", "DE"))
+        await asyncio.sleep(0.6)
+        collecting = asyncio.create_task(extractor.extract("VAT is 7%", "DE"))
+        await asyncio.sleep(0.05)
+
+        await extractor.aclose()
+        for task in (dispatched, collecting):
+            with pytest.raises(RuntimeError, match="shut down"):
+                await task
+        assert not other_tasks()
+        await processor.aclose()
+
+    asyncio.run(main())
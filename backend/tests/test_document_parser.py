@@ -0,0 +1,78 @@
+"""Tests for DocumentParser"""
+
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.document_parser import DocumentParser, _import_pymupdf
+
+
+def _make_pdf(page_count: int) -> bytes:
+    pymupdf = _import_pymupdf()
+    if pymupdf is None:
+        pytest.skip("PyMuPDF not installed")
+    with pymupdf.open() as pdf:
+        for i in range(page_count):
+            pdf.new_page().insert_text((72, 72), f"Page {i + 1} VAT rate 19%")
+        return pdf.tobytes()
+
+
+def test_concurrent_pdf_parses_exceed_default_executor():
+    """More concurrent PDF parses than default-executor threads must not deadlock"""
+    pdf_bytes = _make_pdf(60)
+    parser = DocumentParser(ocr_workers=1)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=2))
+        return await asyncio.wait_for(
+            asyncio.gather(*[parser.parse(pdf_bytes, "doc.pdf") for _ in range(6)]),
+            timeout=60
+        )
+
+    results = asyncio.run(main())
+    assert len(results) == 6
+    for text, metadata in results:
+        assert metadata["pages"] == 60
+        assert "--- Page 60 ---" in text
+
+
+def test_iter_pages_stops_producer_when_consumer_stops_early():
+    pdf_bytes = _make_pdf(40)
+    parser = DocumentParser(ocr_workers=1)
+
+    async def main():
+        pages = parser.iter_pages(pdf_bytes, "doc.pdf")
+        first = await pages.__anext__()
+        await asyncio.wait_for(pages.aclose(), timeout=10)
+        return first
+
+    assert asyncio.run(main()) == (1, "Page 1 VAT rate 19%")
+
+
+def test_spooled_upload_is_opened_without_reading_it(monkeypatch):
+    """A rolled-over upload is opened from its file, not read into memory"""
+    pdf_bytes = _make_pdf(3)
+    upload = tempfile.SpooledTemporaryFile(max_size=1024)
+    upload.write(pdf_bytes)
+    upload.seek(0)
+    assert upload._rolled
+
+    def fail_read(*args):
+        raise AssertionError("upload read into memory")
+
+    monkeypatch.setattr(upload, "read", fail_read)
+    text, metadata = asyncio.run(DocumentParser().parse(upload, "doc.pdf"))
+    assert metadata["pages"] == 3
+    assert "Page 3 VAT rate 19%" in text
+
+
+def test_shutdown_stops_ocr_workers():
+    parser = DocumentParser(ocr_workers=1)
+    parser._ocr_executor.submit(lambda: None).result()
+
+    parser.shutdown()
+    with pytest.raises(RuntimeError):
+        parser._ocr_executor.submit(lambda: None)
@@ -0,0 +1,109 @@
+"""Tests for EntityExtractor response parsing"""
+
+import asyncio
+import logging
+from datetime import date
+
+from services.ai_processor import MockAIProcessor
+from services.entity_extractor import EntityExtractor
+
+
+def make_extractor() -> EntityExtractor:
+    return EntityExtractor(MockAIProcessor())
+
+
+def test_invalid_date_warning_logged_per_occurrence(caplog):
+    extractor = make_extractor()
+    with caplog.at_level(logging.WARNING, logger="services.entity_extractor"):
+        assert extractor._parse_date("31/12/2024") is None
+        assert extractor._parse_date("31/12/2024") is None
+        assert extractor._parse_date("n/a") is None
+    assert [r.getMessage() for r in caplog.records] == ["Invalid date format: 31/12/2024"] * 2
+
+
+def test_parse_date_accepts_iso_dates():
+    extractor = make_extractor()
+    assert extractor._parse_date("2024-01-01") == date(2024, 1, 1)
+    assert extractor._parse_date(" 2024-01-01 ") == date(2024, 1, 1)
+    assert extractor._parse_date(None) is None
+
+
+# Valid rows chosen around Pydantic's coercion edges (empty strings, midnight
+# datetimes, timestamps, numeric strings)
+VALID_RESPONSE = {
+    "tax_types": ["VAT", "INCOME"],
+    "rates": [
+        {"name": "standard", "rate": 0.19, "conditions": ["goods"], "exemptions": []},
+        {"name": "", "rate": "0.07", "description": None},
+    ],
+    "brackets": [{"min_amount": 0, "max_amount": 10000, "rate": 0.1, "fixed_amount": None}],
+    "thresholds": [
+        {"name": "registration", "amount": 22000, "currency": "EUR", "effective_date": "2024-01-01"},
+        {"name": "", "amount": "500", "currency": "", "effective_date": "2024-01-01T00:00:00"},
+        {"name": "small", "amount": 1, "effective_date": 1704067200},
+    ],
+    "deadlines": [
+        {"name": "monthly return", "deadline_type": "filing", "frequency": "monthly", "day_of_period": "10.0"},
+        {"name": "annual", "deadline_type": "", "frequency": "annually", "day_of_period": None},
+    ],
+    "rules": [
+        {"id": "r1", "name": "standard", "description": "", "tax_type": "VAT", "rate": 0.19,
+         "effective_date": "2024-01-01", "expiry_date": None, "brackets": [{"ignored": True}]},
+        {"id": "", "name": "", "description": "reduced", "tax_type": "INCOME", "conditions": ["food"]},
+    ],
+    "summary": "VAT rules",
+    "confidence_score": 0.9,
+    "warnings": ["check thresholds"],
+}
+
+BAD_ROWS = {
+    "tax_types": "sales tax",
+    "rates": {"name": "bad", "rate": 19},
+    "brackets": {"min_amount": -5, "rate": 0.1},
+    "thresholds": {"name": "bad", "amount": None},
+    "deadlines": {"name": "bad", "deadline_type": "filing", "frequency": "monthly", "day_of_period": 10.5},
+    "rules": "not a rule",
+}
+
+
+def test_bad_sibling_row_does_not_change_valid_rows():
+    """The single-pass and per-row parsing paths must agree on every valid row"""
+    extractor = make_extractor()
+    expected = extractor._parse_extraction_response(VALID_RESPONSE)
+
+    for category, bad_row in BAD_ROWS.items():
+        response = dict(VALID_RESPONSE)
+        response[category] = [*VALID_RESPONSE[category], bad_row]
+        parsed = extractor._parse_extraction_response(response)
+        if category == "tax_types":
+            # Unknown tax types are kept as OTHER rather than dropped
+            assert parsed.tax_types == [*expected.tax_types, "OTHER"]
+            parsed.tax_types = expected.tax_types
+        assert parsed.model_dump() == expected.model_dump(), category
+
+
+def test_well_formed_response_keeps_model_coercion():
+    parsed = make_extractor()._parse_extraction_response(VALID_RESPONSE)
+    assert [r.name for r in parsed.rates] == ["standard", ""]
+    assert [t.effective_date for t in parsed.thresholds] == [date(2024, 1, 1)] * 3
+    assert parsed.thresholds[1].currency == ""
+    assert [d.day_of_period for d in parsed.deadlines] == [10, None]
+    assert [r.id for r in parsed.rules] == ["r1", ""]
+    assert parsed.rules[0].brackets is None
+
+
+def test_batched_chunk_extraction_reports_progress():
+    extractor = make_extractor()
+    extractor.chunk_batch_size = 2
+    progress = []
+    chunks = [f"Chunk {i}: VAT standard rate 19%" for i in range(5)]
+
+    merged, responses = asyncio.run(extractor.extract_from_chunks(
+        chunks, "DE", progress_callback=lambda current, total, status: progress.append((current, total))
+    ))
+
+    assert len(responses) == 5
+    # Start, one update per batch of up to 2 chunks, then merging
+    batch_updates = [current for current, _ in progress[1:-1]]
+    assert progress[0] == (0, 5) and progress[-1] == (5, 5)
+    assert len(batch_updates) == 3 and batch_updates == sorted(batch_updates) and batch_updates[-1] == 5
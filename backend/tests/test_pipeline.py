@@ -0,0 +1,51 @@
+"""Tests for ProcessingPipeline"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from services.pipeline import ProcessingPipeline
+
+
+def upper_unless_worker(text: str) -> str:
+    """Kills the worker process it runs in; works normally in the parent"""
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+    return text.upper()
+
+
+def make_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+
+def make_pipeline(**kwargs) -> ProcessingPipeline:
+    return ProcessingPipeline(
+        document_parser=None,
+        ai_processor=None,
+        entity_extractor=None,
+        output_generator=None,
+        response_cache=None,
+        offload_min_chars=1,
+        **kwargs
+    )
+
+
+def test_broken_text_executor_is_replaced():
+    broken_pool = make_pool()
+    pipeline = make_pipeline(text_executor=broken_pool, text_executor_factory=make_pool)
+    try:
+        result = asyncio.run(pipeline.run_text_task(upper_unless_worker, "abc"))
+        assert result == "ABC"
+        assert pipeline.text_executor is not broken_pool
+        assert pipeline.text_executor is not None
+        assert asyncio.run(pipeline.run_text_task(str.lower, "ABC")) == "abc"
+    finally:
+        pipeline.shutdown()
+
+
+def test_broken_text_executor_without_factory_falls_back_inline():
+    pipeline = make_pipeline(text_executor=make_pool())
+    assert asyncio.run(pipeline.run_text_task(upper_unless_worker, "abc")) == "ABC"
+    assert pipeline.text_executor is None
+    assert asyncio.run(pipeline.run_text_task(str.lower, "ABC")) == "abc"